@@ -1,11 +1,29 @@
 # backend/api_server.py - DEBUG VERSION
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g, has_request_context
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import DuplicateKeyError, ExecutionTimeout, OperationFailure
+from bson import ObjectId
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import logging
+import functools
+try:
+    import fcntl
+except ImportError:  # Windows dev server: every worker refreshes snapshots
+    fcntl = None
+import heapq
+import json
+import sqlite3
+import re
+import select
+import socket
+import threading
+import time
+import uuid
 
 # Configure detailed logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -26,6 +44,17 @@ SALES_ORDERS_COLLECTION = os.getenv('MONGODB_COLLECTION_NAME', 'Katana_to_dcl')
 TARGET_ORDERS_COLLECTION = os.getenv('TARGET_ORDERS_COLLECTION_NAME', 'Target_Orders')
 STOCK_TRANSFERS_COLLECTION = os.getenv('STOCK_TRANSFERS_COLLECTION_NAME', 'Stock_Transfers')
 PURCHASE_ORDERS_COLLECTION = 'purchase_orders'
+# Pool sizes are per process; gunicorn.conf.py derives them from the worker/thread count
+MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', 10))
+MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', 1))
+DAILY_ROLLUPS_COLLECTION = os.getenv('DAILY_ROLLUPS_COLLECTION_NAME', 'sales_daily_rollups')
+ROLLUP_STATE_COLLECTION = os.getenv('ROLLUP_STATE_COLLECTION_NAME', 'rollup_state')
+LINE_ITEMS_COLLECTION = os.getenv('LINE_ITEMS_COLLECTION_NAME', 'sales_order_lines')
+DCL_FAILURES_INDEX = [("dcl_result.success", 1), ("created_at", -1)]
+SEARCH_KEYS_COLLECTION = os.getenv('SEARCH_KEYS_COLLECTION_NAME', 'search_keys')
+STATUS_DISTRIBUTION_INDEX = [("created_at", -1), ("status", 1), ("dcl_status", 1)]
+ORDER_TOMBSTONES_COLLECTION = os.getenv('ORDER_TOMBSTONES_COLLECTION_NAME', 'sales_order_tombstones')
+SALES_ORDER_CHANGES_INDEX = [("updated_at", 1), ("_id", 1)]
 
 # DEBUG: Print environment variables (hide password)
 logger.info(f"[DEBUG] MONGODB_CONNECTION_STRING exists: {MONGODB_CONNECTION_STRING is not None}")
@@ -46,9 +75,15 @@ sales_orders_collection = None
 purchase_orders_collection = None
 stock_transfers_collection = None
 target_orders_collection = None
+daily_rollups_collection = None
+rollup_state_collection = None
+search_keys_collection = None
+line_items_collection = None
+order_tombstones_collection = None
 
 def initialize_mongodb():
     global mongo_client, db, sales_orders_collection, purchase_orders_collection, stock_transfers_collection, target_orders_collection
+    global daily_rollups_collection, rollup_state_collection, search_keys_collection, line_items_collection, order_tombstones_collection
     
     try:
         if not MONGODB_CONNECTION_STRING:
@@ -63,8 +98,8 @@ def initialize_mongodb():
             serverSelectionTimeoutMS=5000,     # 5 second timeout for server selection
             connectTimeoutMS=10000,            # 10 second connection timeout
             socketTimeoutMS=30000,             # 30 second socket timeout
-            maxPoolSize=10,                    # Maximum 10 connections in pool
-            minPoolSize=1,                     # Minimum 1 connection in pool
+            maxPoolSize=MONGODB_MAX_POOL_SIZE, # Maximum connections in pool (per process)
+            minPoolSize=MONGODB_MIN_POOL_SIZE, # Minimum connections in pool (per process)
             maxIdleTimeMS=30000,               # Close connections after 30 seconds idle
             waitQueueTimeoutMS=5000,           # Wait 5 seconds for connection from pool
             retryWrites=True,                  # Retry writes on network errors
@@ -91,6 +126,11 @@ def initialize_mongodb():
         purchase_orders_collection = db[PURCHASE_ORDERS_COLLECTION]
         stock_transfers_collection = db[STOCK_TRANSFERS_COLLECTION]
         target_orders_collection = db[TARGET_ORDERS_COLLECTION]
+        daily_rollups_collection = db[DAILY_ROLLUPS_COLLECTION]
+        rollup_state_collection = db[ROLLUP_STATE_COLLECTION]
+        search_keys_collection = db[SEARCH_KEYS_COLLECTION]
+        line_items_collection = db[LINE_ITEMS_COLLECTION]
+        order_tombstones_collection = db[ORDER_TOMBSTONES_COLLECTION]
         
         # Test collections by counting documents
         logger.info("[MONGODB] Testing collections...")
@@ -114,9 +154,9 @@ def initialize_mongodb():
         logger.error(f"[MONGODB ERROR] Error type: {type(e).__name__}")
         return False
 
-# Initialize MongoDB on startup
-mongodb_connected = initialize_mongodb()
-logger.info(f"[STARTUP] MongoDB connected: {mongodb_connected}")
+# MongoDB is connected by init_worker() at the bottom of this module, or after
+# fork in each production worker
+mongodb_connected = False
 
 # backend/api_server.py - Add this after MongoDB connection
 def create_mongodb_indexes():
@@ -135,6 +175,44 @@ def create_mongodb_indexes():
         sales_orders_collection.create_index([("created_at", -1), ("status", 1)])
         sales_orders_collection.create_index([("created_at", -1), ("dcl_status", 1)])
         
+        # Covers the status x DCL status distribution aggregation
+        sales_orders_collection.create_index(STATUS_DISTRIBUTION_INDEX)
+        
+        # Failed DCL submissions only: failure counts and the failures drill-down
+        sales_orders_collection.create_index(DCL_FAILURES_INDEX, partialFilterExpression={"dcl_result.success": False})
+        
+        # Delta sync and incremental rollup maintenance (watermark on updated_at, _id)
+        sales_orders_collection.create_index(SALES_ORDER_CHANGES_INDEX)
+        
+        # Pre-images let deletion tombstones carry the order's created_at (MongoDB 6+)
+        try:
+            db.command("collMod", SALES_ORDERS_COLLECTION, changeStreamPreAndPostImages={"enabled": True})
+            tombstone_watch_state["pre_images"] = True
+        except Exception as e:
+            logger.warning(f"[MONGODB] Could not enable change stream pre-images, deleted orders stay in the daily rollups: {e}")
+        
+        # Tombstones of deleted orders, expired after the retention period
+        order_tombstones_collection.create_index(
+            [("updated_at", 1)],
+            expireAfterSeconds=ORDER_TOMBSTONE_RETENTION_DAYS * 86400
+        )
+        
+        # Analytics rollups are always read by day range
+        daily_rollups_collection.create_index([("day", 1)])
+        
+        # Line item view: product reports by date window, variant lookups, per-order cleanup
+        line_items_collection.create_index([("created_at", -1)])
+        line_items_collection.create_index([("variant_id", 1)])
+        line_items_collection.create_index([("order_id", 1)])
+        
+        # Unified search: normalized keys, plus exact number lookups per collection
+        search_keys_collection.create_index([("keys", 1)])
+        target_orders_collection.create_index([("order_no", 1)])
+        stock_transfers_collection.create_index([("stock_transfer_number", 1)])
+        purchase_orders_collection.create_index([("po_number", 1)])
+        for collection in (target_orders_collection, stock_transfers_collection, purchase_orders_collection):
+            collection.create_index([("updated_at", 1), ("_id", 1)])
+        
         logger.info("[MONGODB] Indexes created successfully")
         return True
         
@@ -142,9 +220,432 @@ def create_mongodb_indexes():
         logger.error(f"[MONGODB ERROR] Failed to create indexes: {e}")
         return False
 
-# Call this after MongoDB connection
-if mongodb_connected:
-    create_mongodb_indexes()
+# ============= QUERY TIME BUDGETS =============
+# Every find, count and aggregate issued while serving a request carries the
+# route's maxTimeMS budget and a per-request comment tag. The tag lets us find
+# and kill the request's server-side operations if the HTTP client goes away.
+DEFAULT_QUERY_BUDGET_MS = int(os.getenv('DEFAULT_QUERY_BUDGET_MS', 10000))
+BACKGROUND_QUERY_BUDGET_MS = int(os.getenv('BACKGROUND_QUERY_BUDGET_MS', 120000))
+DISCONNECT_POLL_SECONDS = float(os.getenv('DISCONNECT_POLL_SECONDS', 0.5))
+
+# Per-route budgets keyed by endpoint (view function) name, overridable with
+# QUERY_BUDGETS_MS='{"get_sales_orders": 5000}'
+QUERY_BUDGETS_MS = {
+    'get_dashboard_stats': 5000,
+    'get_sales_orders': 8000,
+    'get_sales_stats': 15000,
+    'find_bad_sales_orders': 30000,
+    'get_sales_orders_filters': 5000,
+    'get_analytics_timeseries': 3000,
+    'get_status_distribution': 3000,
+    'search_orders': 3000,
+    'get_variant_analytics': 5000,
+    'get_dcl_failures': 5000,
+    'get_sales_order_changes': 5000,
+    'refresh_analytics_rollups': 120000
+}
+QUERY_BUDGETS_MS.update(json.loads(os.getenv('QUERY_BUDGETS_MS', '{}')))
+
+def query_budget_ms():
+    """maxTimeMS for queries issued in the current context"""
+    if not has_request_context():
+        return BACKGROUND_QUERY_BUDGET_MS
+    return QUERY_BUDGETS_MS.get(request.endpoint, DEFAULT_QUERY_BUDGET_MS)
+
+def query_options():
+    """Keyword arguments applying the current budget and request tag to count_documents/aggregate"""
+    options = {"maxTimeMS": query_budget_ms()}
+    if has_request_context() and g.get('query_tag'):
+        options["comment"] = g.query_tag
+    return options
+
+def budgeted(cursor):
+    """Apply the current budget and request tag to a find() cursor"""
+    cursor = cursor.max_time_ms(query_budget_ms())
+    if has_request_context() and g.get('query_tag'):
+        cursor = cursor.comment(g.query_tag)
+    return cursor
+
+def query_timeout_response(e):
+    logger.warning(f"[API] Query exceeded time budget for {request.endpoint}: {e}")
+    return jsonify({
+        "status": "error",
+        "message": "Query exceeded its time budget",
+        "budget_ms": query_budget_ms(),
+        "type": type(e).__name__
+    }), 504
+
+# Requests being watched for client disconnect: query tag -> client socket
+watched_requests = {}
+watched_requests_lock = threading.Lock()
+disconnect_monitor_started = False
+
+def client_socket():
+    """The raw client socket, when the WSGI server exposes it"""
+    return request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+
+def client_disconnected(sock):
+    """True only if the peer has closed the connection (readable with EOF, or reset)
+    
+    poll() rather than select(): select() cannot watch fds >= 1024, which a
+    busy worker with many keep-alive connections reaches.
+    """
+    try:
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        if not poller.poll(0):
+            return False
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+    except (BlockingIOError, InterruptedError):
+        return False
+    except (ConnectionResetError, BrokenPipeError):
+        return True
+    except (OSError, ValueError):
+        # Socket already closed or unusable on our side: not evidence of a disconnect
+        return False
+
+def cancel_tagged_queries(tag):
+    """Kill every server-side operation carrying the given comment tag"""
+    ops = mongo_client.admin.aggregate([
+        {"$currentOp": {}},
+        {"$match": {"$or": [{"command.comment": tag}, {"cursor.originatingCommand.comment": tag}]}}
+    ])
+    for op in ops:
+        mongo_client.admin.command('killOp', op=op['opid'])
+        logger.info(f"[API] Killed operation {op['opid']} for disconnected request {tag}")
+
+def disconnect_monitor_loop():
+    while True:
+        time.sleep(DISCONNECT_POLL_SECONDS)
+        with watched_requests_lock:
+            watched = list(watched_requests.items())
+        for tag, sock in watched:
+            if not client_disconnected(sock):
+                continue
+            with watched_requests_lock:
+                watched_requests.pop(tag, None)
+            try:
+                cancel_tagged_queries(tag)
+            except Exception as e:
+                logger.error(f"[API ERROR] Failed to cancel queries for {tag}: {e}")
+
+@app.before_request
+def tag_request_queries():
+    global disconnect_monitor_started
+    g.query_tag = f"req-{uuid.uuid4().hex}"
+
+    sock = client_socket()
+    if sock is None or not mongodb_connected:
+        return
+
+    with watched_requests_lock:
+        watched_requests[g.query_tag] = sock
+        if not disconnect_monitor_started:
+            threading.Thread(target=disconnect_monitor_loop, name="disconnect-monitor", daemon=True).start()
+            disconnect_monitor_started = True
+
+@app.teardown_request
+def untag_request_queries(exc=None):
+    with watched_requests_lock:
+        watched_requests.pop(g.get('query_tag'), None)
+
+# ============= RESOURCE BUDGETS =============
+# Limits that keep one careless call from pinning a worker: page sizes are
+# capped, queries examine at most MAX_SCAN_DOCUMENTS documents, and responses
+# are refused above MAX_RESPONSE_BYTES. When a trusted layer in front of the API
+# identifies clients (CLIENT_ID_HEADER), each client may only have
+# MAX_CONCURRENT_REQUESTS_PER_CLIENT requests in flight per worker process.
+# Every cap or rejection is counted in budget_stats (see /api/test).
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+MAX_SCAN_DOCUMENTS = int(os.getenv('MAX_SCAN_DOCUMENTS', 50000))
+MAX_RESPONSE_BYTES = int(os.getenv('MAX_RESPONSE_BYTES', 5 * 1024 * 1024))
+MAX_CONCURRENT_REQUESTS_PER_CLIENT = int(os.getenv('MAX_CONCURRENT_REQUESTS_PER_CLIENT', 8))
+# e.g. a user id header set by the auth proxy; unset leaves the limit off
+CLIENT_ID_HEADER = os.getenv('CLIENT_ID_HEADER')
+
+budget_stats = {
+    "page_size_capped": 0,
+    "skip_rejected": 0,
+    "scan_truncated": 0,
+    "response_too_large": 0,
+    "client_concurrency_rejected": 0
+}
+budget_stats_lock = threading.Lock()
+
+client_requests = {}
+client_requests_lock = threading.Lock()
+
+def count_budget_event(name):
+    with budget_stats_lock:
+        budget_stats[name] += 1
+
+def page_limit(default, maximum=None):
+    """The 'limit' argument, capped at the endpoint's maximum and never above MAX_PAGE_SIZE"""
+    maximum = min(maximum or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+    limit = int(request.args.get('limit', min(default, maximum)))
+    if limit > maximum:
+        count_budget_event("page_size_capped")
+        logger.info(f"[BUDGET] {request.endpoint} limit {limit} capped at {maximum}")
+        limit = maximum
+    return max(limit, 1)
+
+def client_id():
+    """Who a request counts against, or None when clients are not identified
+    
+    Addresses are deliberately not used: behind a proxy or NAT every dashboard
+    user would share one address, and so one set of slots.
+    """
+    if not CLIENT_ID_HEADER:
+        return None
+    return request.headers.get(CLIENT_ID_HEADER) or None
+
+def budget_error(message, status, **details):
+    return jsonify({"status": "error", "message": message, **details}), status
+
+@app.before_request
+def limit_client_concurrency():
+    client = client_id()
+    if client is None or g.get('snapshot_refresh'):
+        return
+
+    with client_requests_lock:
+        in_flight = client_requests.get(client, 0)
+        if in_flight >= MAX_CONCURRENT_REQUESTS_PER_CLIENT:
+            count_budget_event("client_concurrency_rejected")
+            logger.warning(f"[BUDGET] Rejected {request.endpoint} for {client}: {in_flight} requests in flight")
+            response = app.make_response(budget_error(
+                "Too many concurrent requests from this client",
+                429,
+                max_concurrent_requests=MAX_CONCURRENT_REQUESTS_PER_CLIENT
+            ))
+            response.headers["Retry-After"] = "1"
+            return response
+        client_requests[client] = in_flight + 1
+    g.budget_client = client
+
+@app.teardown_request
+def release_client_slot(exc=None):
+    client = g.pop('budget_client', None)
+    if client is None:
+        return
+    with client_requests_lock:
+        remaining = client_requests.get(client, 1) - 1
+        if remaining > 0:
+            client_requests[client] = remaining
+        else:
+            client_requests.pop(client, None)
+
+@app.after_request
+def limit_response_size(response):
+    if response.direct_passthrough or response.content_length is None or response.content_length <= MAX_RESPONSE_BYTES:
+        return response
+
+    count_budget_event("response_too_large")
+    logger.warning(f"[BUDGET] {request.endpoint} response of {response.content_length} bytes refused (max {MAX_RESPONSE_BYTES})")
+    # Registered after CORS(app), so this runs first and CORS headers still get added
+    return app.make_response(budget_error(
+        "Response too large, narrow the filters or lower the limit",
+        400,
+        max_response_bytes=MAX_RESPONSE_BYTES
+    ))
+
+# ============= REQUEST COALESCING (SINGLE-FLIGHT) =============
+# Identical concurrent requests (same route, same normalized parameters) share
+# one execution: the first caller runs the view, the others wait for it and
+# reuse its serialized response. Coalescing is per worker process.
+single_flight_calls = {}
+single_flight_lock = threading.Lock()
+single_flight_stats = {"executed": 0, "coalesced": 0}
+
+def single_flight_key():
+    """Route + query parameters with empty values dropped and order normalized"""
+    params = sorted(
+        (name, value.strip())
+        for name, value in request.args.items(multi=True)
+        if value.strip()
+    )
+    return (request.endpoint, tuple(params))
+
+def single_flight(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = single_flight_key()
+
+        with single_flight_lock:
+            flight = single_flight_calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = {"done": threading.Event(), "result": None}
+                single_flight_calls[key] = flight
+
+        if leader:
+            try:
+                response = app.make_response(view(*args, **kwargs))
+                # Errors are not shared: waiting callers retry on their own
+                if response.status_code < 500:
+                    flight["result"] = (response.get_data(), response.status_code, response.mimetype)
+                return response
+            finally:
+                with single_flight_lock:
+                    single_flight_calls.pop(key, None)
+                    single_flight_stats["executed"] += 1
+                flight["done"].set()
+
+        # Wait a little longer than the leader's query budget before giving up on it
+        if flight["done"].wait(query_budget_ms() / 1000 * 2) and flight["result"] is not None:
+            body, status, mimetype = flight["result"]
+            with single_flight_lock:
+                single_flight_stats["coalesced"] += 1
+            logger.debug(f"[API] Coalesced {request.endpoint} onto in-flight request")
+            return app.response_class(body, status=status, mimetype=mimetype)
+
+        return view(*args, **kwargs)
+
+    return wrapper
+
+# ============= LOCAL SNAPSHOTS =============
+# The dashboard's landing payloads (stats, filters, recent orders) are saved to
+# a local SQLite file on a schedule. Until this worker has seen the cluster
+# answer, and whenever a live call fails, the last saved payload is served
+# instead, marked with its age. Snapshots are keyed like single-flight calls,
+# so only the exact requests listed in SNAPSHOT_PATHS are covered. One worker
+# per host (holding a file lock) replays them; it records whether the cluster
+# answered in SNAPSHOT_STATUS_KEY, which the other workers follow.
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard_snapshots.sqlite3'))
+SNAPSHOT_REFRESH_SECONDS = int(os.getenv('SNAPSHOT_REFRESH_SECONDS', 60))
+SNAPSHOT_PATHS = [
+    '/api/dashboard-stats',
+    '/api/sales-stats',
+    '/api/recent-orders?limit=10',
+    '/api/sales-orders?page=1&limit=5',
+    '/api/sales-orders?page=1&limit=20',
+    '/api/sales-orders/filters',
+    '/api/status-distribution'
+]
+
+SNAPSHOT_STATUS_KEY = '__status__'
+
+# Open (and flock-ed) for the lifetime of the worker that owns the replay
+snapshot_lock_file = None
+
+# False until a snapshot refresh gets live answers, and again after one that gets none
+snapshot_state = {"live": False, "saved": 0, "served": 0}
+
+def snapshot_db():
+    conn = sqlite3.connect(SNAPSHOT_PATH, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS snapshots (key TEXT PRIMARY KEY, payload TEXT NOT NULL, saved_at REAL NOT NULL)")
+    return conn
+
+def snapshot_key():
+    return json.dumps(single_flight_key())
+
+def save_snapshot(key, payload):
+    with closing(snapshot_db()) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO snapshots (key, payload, saved_at) VALUES (?, ?, ?)", (key, payload, time.time()))
+
+def load_snapshot(key):
+    try:
+        with closing(snapshot_db()) as conn:
+            return conn.execute("SELECT payload, saved_at FROM snapshots WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        logger.error(f"[SNAPSHOT ERROR] Could not read snapshot: {e}")
+        return None
+
+def shared_snapshots_live():
+    """Whether the host's snapshot refresher last got live answers (recently)"""
+    status = load_snapshot(SNAPSHOT_STATUS_KEY)
+    if not status or time.time() - status[1] > SNAPSHOT_REFRESH_SECONDS * 2:
+        return False
+    return json.loads(status[0]).get("live", False)
+
+def snapshot_response(snapshot, reason):
+    payload, saved_at = snapshot
+    age = max(0, int(time.time() - saved_at))
+    body = json.loads(payload)
+    body["snapshot"] = {
+        "saved_at": datetime.fromtimestamp(saved_at).isoformat(),
+        "age_seconds": age,
+        "reason": reason
+    }
+    snapshot_state["served"] += 1
+    response = jsonify(body)
+    response.headers["Age"] = str(age)
+    return response
+
+def snapshot_fallback(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if g.get('snapshot_refresh'):
+            return view(*args, **kwargs)
+
+        key = snapshot_key()
+        if not snapshot_state["live"] and shared_snapshots_live():
+            snapshot_state["live"] = True
+        if not snapshot_state["live"]:
+            snapshot = load_snapshot(key)
+            if snapshot:
+                return snapshot_response(snapshot, "database not reachable yet")
+
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except Exception:
+            snapshot = load_snapshot(key)
+            if snapshot:
+                return snapshot_response(snapshot, "database unavailable")
+            raise
+        if response.status_code >= 500:
+            snapshot = load_snapshot(key)
+            if snapshot:
+                return snapshot_response(snapshot, "database unavailable")
+        return response
+
+    return wrapper
+
+def refresh_snapshots():
+    """Run every SNAPSHOT_PATHS request live and save the successful responses.
+    
+    The first worker on the host to take the file lock keeps it (and the file
+    open) for its lifetime and is the only one that replays; the others follow
+    its status, and take over when it exits and the OS drops the lock.
+    """
+    global snapshot_lock_file
+    if fcntl and snapshot_lock_file is None:
+        lock_file = open(SNAPSHOT_PATH + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            snapshot_state["live"] = shared_snapshots_live()
+            return 0
+        snapshot_lock_file = lock_file
+        logger.info(f"[SNAPSHOT] Worker {os.getpid()} owns snapshot refresh")
+    return replay_snapshot_paths()
+
+def replay_snapshot_paths():
+    saved = 0
+    for path in SNAPSHOT_PATHS:
+        with app.test_request_context(path):
+            g.snapshot_refresh = True
+            key = snapshot_key()
+            try:
+                response = app.full_dispatch_request()
+            except Exception as e:
+                logger.debug(f"[SNAPSHOT] {path} not refreshed: {e}")
+                continue
+            body = response.get_json(silent=True) or {}
+            if response.status_code == 200 and body.get("status") == "success":
+                save_snapshot(key, response.get_data(as_text=True))
+                saved += 1
+
+    if saved and not snapshot_state["live"]:
+        logger.info("[SNAPSHOT] Database answering, serving live data")
+    elif not saved and snapshot_state["live"]:
+        logger.warning("[SNAPSHOT] No live answers, serving snapshots")
+    snapshot_state["live"] = saved > 0
+    snapshot_state["saved"] += saved
+    save_snapshot(SNAPSHOT_STATUS_KEY, json.dumps({"live": saved > 0}))
+    return saved
 
 # ============= TEST ENDPOINT WITH DETAILED INFO =============
 @app.route('/api/test', methods=['GET'])
@@ -162,11 +663,16 @@ def test_api():
             "target_orders": TARGET_ORDERS_COLLECTION
         },
         "connection_string_provided": MONGODB_CONNECTION_STRING is not None,
+        "single_flight": single_flight_stats,
+        "snapshots": snapshot_state,
+        "budgets": budget_stats,
         "timestamp": datetime.now().isoformat()
     })
 
 # ============= DASHBOARD STATS WITH BETTER ERROR HANDLING =============
 @app.route('/api/dashboard-stats', methods=['GET'])
+@snapshot_fallback
+@single_flight
 def get_dashboard_stats():
     """Get overall dashboard statistics"""
     try:
@@ -185,10 +691,10 @@ def get_dashboard_stats():
         
         # Sales Orders Stats
         logger.info("[API] Counting sales orders...")
-        total_sales_orders = sales_orders_collection.count_documents({})
-        pending_sales_orders = sales_orders_collection.count_documents({"status": "pending"})
-        completed_sales_orders = sales_orders_collection.count_documents({"status": "complete"})
-        failed_sales_orders = sales_orders_collection.count_documents({"dcl_result.success": False})
+        total_sales_orders = sales_orders_collection.count_documents({}, **query_options())
+        pending_sales_orders = sales_orders_collection.count_documents({"status": "pending"}, **query_options())
+        completed_sales_orders = sales_orders_collection.count_documents({"status": "complete"}, **query_options())
+        failed_sales_orders = sales_orders_collection.count_documents({"dcl_result.success": False}, **query_options())
         
         logger.info(f"[API] Sales orders: total={total_sales_orders}, pending={pending_sales_orders}, completed={completed_sales_orders}, failed={failed_sales_orders}")
         
@@ -207,6 +713,8 @@ def get_dashboard_stats():
             }
         })
         
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
     except Exception as e:
         logger.error(f"[API ERROR] Dashboard stats error: {e}")
         return jsonify({
@@ -652,8 +1160,127 @@ def get_dashboard_stats():
 #             "type": type(e).__name__
 #         }), 500
 
+# ============= DATE FILTER HELPERS =============
+DATE_FILTERS = [
+    {"value": "today", "label": "Today"},
+    {"value": "yesterday", "label": "Yesterday"},
+    {"value": "last_7_days", "label": "Last 7 Days"},
+    {"value": "last_30_days", "label": "Last 30 Days"}
+]
+
+def get_date_filter_range(date_filter, now=None):
+    """Return the created_at range for a named date filter, or None if unknown"""
+    now = now or datetime.now()
+    
+    if date_filter == 'today':
+        start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        end_of_day = now.replace(hour=23, minute=59, second=59, microsecond=999999)
+        return {'$gte': start_of_day, '$lte': end_of_day}
+        
+    elif date_filter == 'yesterday':
+        yesterday = now - timedelta(days=1)
+        start_of_yesterday = yesterday.replace(hour=0, minute=0, second=0, microsecond=0)
+        end_of_yesterday = yesterday.replace(hour=23, minute=59, second=59, microsecond=999999)
+        return {'$gte': start_of_yesterday, '$lte': end_of_yesterday}
+        
+    elif date_filter == 'last_7_days':
+        return {'$gte': now - timedelta(days=7)}
+        
+    elif date_filter == 'last_30_days':
+        return {'$gte': now - timedelta(days=30)}
+    
+    return None
+
+def parse_iso_utc(value):
+    """Parse an ISO timestamp ('Z' or any offset) into naive UTC, as stored in MongoDB.
+    
+    Timestamps without an offset are taken as UTC. Raises ValueError.
+    """
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed
+
+# ============= SALES ORDER LIST FORMATS =============
+# Only the fields the list views use: addresses and the rest of the Katana
+# payload stay in MongoDB
+SALES_ORDER_LIST_PROJECTION = {
+    "katana_order_id": 1,
+    "katana_order_number": 1,
+    "status": 1,
+    "dcl_status": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "katana_order_data.total": 1,
+    "katana_order_data.currency": 1,
+    "katana_order_data.location_id": 1,
+    "katana_order_data.order_created_date": 1,
+    "katana_order_data.delivery_date": 1,
+    "katana_order_data.sales_order_rows": 1
+}
+
+def format_sales_order_row(order):
+    """Row format of a sales order, as used by the SalesOrders page"""
+    katana_data = order.get('katana_order_data') or {}
+    
+    return {
+        "id": str(order.get('_id')),
+        "_id": str(order.get('_id')),
+        "katana_order_id": order.get('katana_order_id'),
+        "katana_order_number": order.get('katana_order_number', 'N/A'),
+        "order_number": order.get('katana_order_number', 'N/A'),
+        "status": order.get('status', 'N/A'),
+        "dcl_status": order.get('dcl_status', 'N/A'),
+        "total": katana_data.get('total', 0),
+        "currency": katana_data.get('currency', 'USD'),
+        "items_count": len(katana_data.get('sales_order_rows', []) if isinstance(katana_data.get('sales_order_rows', []), list) else []),
+        "location_id": katana_data.get('location_id'),
+        "created_at": order.get('created_at'),
+        "updated_at": order.get('updated_at'),
+        "order_created_date": katana_data.get('order_created_date'),
+        "delivery_date": katana_data.get('delivery_date'),
+        "katana_order_data": {
+            "order_created_date": katana_data.get("order_created_date"),
+            "delivery_date": katana_data.get("delivery_date"),
+            "total": katana_data.get("total"),
+            "currency": katana_data.get("currency"),
+            "sales_order_rows": katana_data.get("sales_order_rows", []) if isinstance(katana_data.get("sales_order_rows", []), list) else []
+        }
+    }
+
+# format=columnar: one array per field, in this order. The row format's
+# aliases (id, order_number) and its nested katana_order_data copy are dropped.
+SALES_ORDER_COLUMNS = [
+    "_id", "katana_order_id", "katana_order_number", "status", "dcl_status",
+    "total", "currency", "items_count", "location_id", "created_at", "updated_at",
+    "order_created_date", "delivery_date", "sales_order_rows"
+]
+
+def sales_orders_columnar(orders):
+    """Build the SALES_ORDER_COLUMNS arrays column by column, without a dict per order"""
+    katana = [o.get('katana_order_data') if isinstance(o.get('katana_order_data'), dict) else {} for o in orders]
+    rows = [k.get('sales_order_rows') if isinstance(k.get('sales_order_rows'), list) else [] for k in katana]
+    return [
+        [str(o['_id']) for o in orders],
+        [o.get('katana_order_id') for o in orders],
+        [o.get('katana_order_number', 'N/A') for o in orders],
+        [o.get('status', 'N/A') for o in orders],
+        [o.get('dcl_status', 'N/A') for o in orders],
+        [k.get('total', 0) for k in katana],
+        [k.get('currency', 'USD') for k in katana],
+        [len(r) for r in rows],
+        [k.get('location_id') for k in katana],
+        [o.get('created_at') for o in orders],
+        [o.get('updated_at') for o in orders],
+        [k.get('order_created_date') for k in katana],
+        [k.get('delivery_date') for k in katana],
+        rows
+    ]
+
 # backend/app.py - FIXED pagination logic
 @app.route('/api/sales-orders', methods=['GET'])
+@snapshot_fallback
+@single_flight
 def get_sales_orders():
     """Get sales orders with consistent pagination"""
     try:
@@ -670,11 +1297,21 @@ def get_sales_orders():
         # Test connection
         mongo_client.admin.command('ping')
         
-        limit = min(int(request.args.get('limit', 20)), 100)
-
         # Pagination parameters
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 20))
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = page_limit(20)
+        if (page - 1) * limit > MAX_SCAN_DOCUMENTS:
+            count_budget_event("skip_rejected")
+            return budget_error(
+                f"Pages beyond the first {MAX_SCAN_DOCUMENTS} matching orders are not available, narrow the filters",
+                400,
+                max_scan_documents=MAX_SCAN_DOCUMENTS
+            )
+        
+        # Response format: 'rows' (list of objects, default) or 'columnar'
+        response_format = request.args.get('format', 'rows')
+        if response_format not in ('rows', 'columnar'):
+            return jsonify({"status": "error", "message": "format must be 'rows' or 'columnar'"}), 400
         
         # Filter parameters
         date_filter = request.args.get('date_filter', '')
@@ -691,28 +1328,9 @@ def get_sales_orders():
         query = {}
         
         # Date filters
-        if date_filter:
-            from datetime import datetime, timedelta
-            now = datetime.now()
-            
-            if date_filter == 'today':
-                start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-                end_of_day = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-                query['created_at'] = {'$gte': start_of_day, '$lte': end_of_day}
-                
-            elif date_filter == 'yesterday':
-                yesterday = now - timedelta(days=1)
-                start_of_yesterday = yesterday.replace(hour=0, minute=0, second=0, microsecond=0)
-                end_of_yesterday = yesterday.replace(hour=23, minute=59, second=59, microsecond=999999)
-                query['created_at'] = {'$gte': start_of_yesterday, '$lte': end_of_yesterday}
-                
-            elif date_filter == 'last_7_days':
-                seven_days_ago = now - timedelta(days=7)
-                query['created_at'] = {'$gte': seven_days_ago}
-                
-            elif date_filter == 'last_30_days':
-                thirty_days_ago = now - timedelta(days=30)
-                query['created_at'] = {'$gte': thirty_days_ago}
+        date_range = get_date_filter_range(date_filter)
+        if date_range:
+            query['created_at'] = date_range
         
         # Custom date range
         if start_date and end_date:
@@ -723,10 +1341,6 @@ def get_sales_orders():
             except ValueError:
                 logger.warning(f"[API] Invalid date format: start_date={start_date}, end_date={end_date}")
         
-        # Order number filter (partial match)
-        if order_number:
-            query['katana_order_number'] = {'$regex': order_number, '$options': 'i'}
-        
         # Status filters
         if status_filter:
             query['status'] = status_filter
@@ -734,29 +1348,54 @@ def get_sales_orders():
         if dcl_status_filter:
             query['dcl_status'] = dcl_status_filter
         
-        # ✅ FIXED: Always get total count for consistent pagination
-        logger.info("[API] Getting total count...")
-        total_count = sales_orders_collection.count_documents(query)
-        logger.info(f"[API] Total count: {total_count}")
+        # Order number filter (partial match). An unanchored regex cannot use the
+        # index, so it is applied after the scan window below, not in the query
+        order_number_match = {'katana_order_number': {'$regex': order_number, '$options': 'i'}} if order_number else {}
         
-        # Calculate pagination info
-        total_pages = (total_count + limit - 1) // limit if total_count > 0 else 0
         skip = (page - 1) * limit
         
         # ✅ FIXED: Use consistent skip-based pagination for simplicity
-        logger.info(f"[API] Using skip-based pagination: skip={skip}, limit={limit}")
+        # At most MAX_SCAN_DOCUMENTS orders (newest first, from the indexed
+        # filters) are examined; count and page both come from that window.
+        # When the window is full, the count is a lower bound and the page may
+        # miss older matches.
+        logger.info(f"[API] Using skip-based pagination within scan window: skip={skip}, limit={limit}")
+        window = next(sales_orders_collection.aggregate([
+            {"$match": query},
+            {"$sort": {"created_at": -1}},
+            {"$limit": MAX_SCAN_DOCUMENTS},
+            {"$project": SALES_ORDER_LIST_PROJECTION},
+            {"$facet": {
+                "scanned": [{"$count": "count"}],
+                "total": [{"$match": order_number_match}, {"$count": "count"}],
+                # One extra document tells us whether there is a next page when the count is a lower bound
+                "page": [{"$match": order_number_match}, {"$skip": skip}, {"$limit": limit + 1}]
+            }}
+        ], **query_options()), {})
+        
+        scanned = (window.get("scanned") or [{"count": 0}])[0]["count"]
+        total_count = (window.get("total") or [{"count": 0}])[0]["count"]
+        scan_truncated = scanned >= MAX_SCAN_DOCUMENTS
+        count_exact = not scan_truncated
+        if scan_truncated:
+            count_budget_event("scan_truncated")
+        logger.info(f"[API] Total count: {total_count} (exact: {count_exact})")
         
-        sales_orders = list(
-            sales_orders_collection.find(query)
-            .sort("created_at", -1)
-            .skip(skip)
-            .limit(limit)
-        )
+        # Calculate pagination info
+        if count_exact:
+            total_pages = (total_count + limit - 1) // limit if total_count > 0 else 0
+        else:
+            total_pages = None
+        
+        sales_orders = window.get("page", [])
+        has_more = len(sales_orders) > limit
+        sales_orders = sales_orders[:limit]
         
         logger.info(f"[API] Found {len(sales_orders)} sales orders")
         
         # Format data with complete structure for frontend
         formatted_orders = []
+        columns = sales_orders_columnar(sales_orders) if response_format == 'columnar' else None
         
         # for order in sales_orders:
         #     katana_data = order.get('katana_order_data', {})
@@ -793,73 +1432,64 @@ def get_sales_orders():
         #         logger.error(f"[ORDER DEBUG] Error processing order ID: {order.get('_id')}, error: {e}")
         
 
-        for order in sales_orders:
+        for order in (sales_orders if columns is None else []):
             try:
-                katana_data = order.get('katana_order_data') or {}
-
-                formatted_order = {
-                    "id": str(order.get('_id')),
-                    "_id": str(order.get('_id')),
-                    "katana_order_id": order.get('katana_order_id'),
-                    "katana_order_number": order.get('katana_order_number', 'N/A'),
-                    "order_number": order.get('katana_order_number', 'N/A'),
-                    "status": order.get('status', 'N/A'),
-                    "dcl_status": order.get('dcl_status', 'N/A'),
-                    "total": katana_data.get('total', 0),
-                    "currency": katana_data.get('currency', 'USD'),
-                    "items_count": len(katana_data.get('sales_order_rows', []) if isinstance(katana_data.get('sales_order_rows', []), list) else []),
-                    "location_id": katana_data.get('location_id'),
-                    "created_at": order.get('created_at'),
-                    "updated_at": order.get('updated_at'),
-                    "order_created_date": katana_data.get('order_created_date'),
-                    "delivery_date": katana_data.get('delivery_date'),
-                    "katana_order_data": {
-                        "order_created_date": katana_data.get("order_created_date"),
-                        "delivery_date": katana_data.get("delivery_date"),
-                        "total": katana_data.get("total"),
-                        "currency": katana_data.get("currency"),
-                        "sales_order_rows": katana_data.get("sales_order_rows", []) if isinstance(katana_data.get("sales_order_rows", []), list) else []
-                    }
-                }
-
-                formatted_orders.append(formatted_order)
+                formatted_orders.append(format_sales_order_row(order))
 
             except Exception as e:
                 logger.error(f"[API ERROR] Skipping order ID: {order.get('_id')} due to error: {e}")
                 continue
 
 
+        returned = len(formatted_orders) if columns is None else len(sales_orders)
+        
         # ✅ FIXED: Always provide consistent pagination data
-        has_next = page < total_pages
+        has_next = page < total_pages if count_exact else has_more
         has_prev = page > 1
         
         pagination_data = {
             "current_page": page,
             "total_pages": total_pages,
             "total_count": total_count,
+            "count_exact": count_exact,
+            "scan_truncated": scan_truncated,
             "has_next": has_next,
             "has_prev": has_prev,
             "limit": limit,
-            "showing_from": skip + 1 if total_count > 0 else 0,
-            "showing_to": min(skip + len(formatted_orders), total_count)
+            "showing_from": skip + 1 if returned else 0,
+            "showing_to": skip + returned
         }
         
         logger.info(f"[API] Pagination data: {pagination_data}")
         
+        filters_applied = {
+            "date_filter": date_filter,
+            "order_number": order_number,
+            "status": status_filter,
+            "dcl_status": dcl_status_filter,
+            "start_date": start_date,
+            "end_date": end_date
+        }
+        
+        if columns is not None:
+            return jsonify({
+                "status": "success",
+                "format": "columnar",
+                "schema": SALES_ORDER_COLUMNS,
+                "columns": columns,
+                "pagination": pagination_data,
+                "filters_applied": filters_applied
+            })
+        
         return jsonify({
             "status": "success",
             "data": formatted_orders,
             "pagination": pagination_data,
-            "filters_applied": {
-                "date_filter": date_filter,
-                "order_number": order_number,
-                "status": status_filter,
-                "dcl_status": dcl_status_filter,
-                "start_date": start_date,
-                "end_date": end_date
-            }
+            "filters_applied": filters_applied
         })
         
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
     except Exception as e:
         logger.error(f"[API ERROR] Sales orders error: {e}")
         import traceback
@@ -871,77 +1501,1369 @@ def get_sales_orders():
         }), 500
 
 @app.route('/api/sales-stats', methods=['GET'])
+@snapshot_fallback
+@single_flight
 def get_sales_stats():
-    orders = list(sales_orders_collection.find({}))
+    if not mongodb_connected or not mongo_client:
+        return jsonify({"status": "error", "message": "Database connection failed"}), 500
     
-    from datetime import datetime
-    today = datetime.utcnow().date()
-
-    orders_today = [o for o in orders if o.get("created_at") and o["created_at"].date() == today]
-    completed = [o for o in orders if o.get("status") == "complete"]
-    pending = [o for o in orders if o.get("status") == "pending"]
-    failed = [o for o in orders if o.get("status") == "failed"]
+    # Counted on the created_at and status indexes instead of loading every order
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    try:
+        total = sales_orders_collection.estimated_document_count(maxTimeMS=query_budget_ms())
+        orders_today = sales_orders_collection.count_documents({"created_at": {"$gte": today, "$lt": today + timedelta(days=1)}}, **query_options())
+        completed = sales_orders_collection.count_documents({"status": "complete"}, **query_options())
+        pending = sales_orders_collection.count_documents({"status": "pending"}, **query_options())
+        failed = sales_orders_collection.count_documents({"status": "failed"}, **query_options())
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
 
     stats = {
-        "ordersToday": len(orders_today),
-        "completedOrders": len(completed),
-        "pendingOrders": len(pending),
-        "failedOrders": len(failed),
-        "successRate": round(len(completed) / len(orders) * 100) if orders else 0,
+        "ordersToday": orders_today,
+        "completedOrders": completed,
+        "pendingOrders": pending,
+        "failedOrders": failed,
+        "successRate": round(completed / total * 100) if total else 0,
         "avgProcessingTime": "3.0 min"  # Replace with actual average if needed
     }
     return jsonify({"status": "success", "data": stats})
 
+@app.route('/api/recent-orders', methods=['GET'])
+@snapshot_fallback
+@single_flight
+def get_recent_orders():
+    """Get the latest sales orders, in the same row format as /api/sales-orders"""
+    try:
+        if not mongodb_connected or not mongo_client:
+            return jsonify({"status": "error", "message": "Database connection failed"}), 500
+        
+        limit = page_limit(10, 50)
+        orders = budgeted(sales_orders_collection.find({}, SALES_ORDER_LIST_PROJECTION).sort("created_at", -1).limit(limit))
+        
+        return jsonify({"status": "success", "data": [format_sales_order_row(order) for order in orders]})
+    
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
+    except Exception as e:
+        logger.error(f"[API ERROR] Recent orders error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/sales-orders/bad-records', methods=['GET'])
 def find_bad_sales_orders():
+    # Only the newest MAX_SCAN_DOCUMENTS orders are examined, and the check runs
+    # server-side so only the ids of bad records come back
+    try:
+        scan_limit = int(request.args.get('scan_limit', MAX_SCAN_DOCUMENTS))
+    except ValueError:
+        return budget_error("scan_limit must be an integer", 400)
+    if scan_limit < 1:
+        return budget_error("scan_limit must be at least 1", 400)
+    scan_limit = min(scan_limit, MAX_SCAN_DOCUMENTS)
     bad_orders = []
-    for order in sales_orders_collection.find({}).sort("created_at", -1):
-        try:
-            katana_data = order.get('katana_order_data')
-            if not isinstance(katana_data, dict):
-                bad_orders.append(str(order.get('_id')))
-            elif not isinstance(katana_data.get('sales_order_rows', []), list):
-                bad_orders.append(str(order.get('_id')))
-        except Exception:
+    try:
+        for order in sales_orders_collection.aggregate([
+            {"$sort": {"created_at": -1}},
+            {"$limit": scan_limit},
+            {"$match": {"$or": [
+                {"katana_order_data": {"$not": {"$type": "object"}}},
+                {"katana_order_data.sales_order_rows": {"$exists": True, "$not": {"$type": "array"}}}
+            ]}},
+            {"$project": {"_id": 1}}
+        ], **query_options()):
             bad_orders.append(str(order.get('_id')))
-    return jsonify({"bad_records": bad_orders, "count": len(bad_orders)})
+        total = sales_orders_collection.estimated_document_count()
+    except ExecutionTimeout:
+        # Report what was scanned before the budget ran out
+        logger.warning("[API] Bad records scan exceeded time budget, returning partial result")
+        return jsonify({"bad_records": bad_orders, "count": len(bad_orders), "partial": True})
+    if total > scan_limit:
+        count_budget_event("scan_truncated")
+    return jsonify({"bad_records": bad_orders, "count": len(bad_orders), "scanned": min(total, scan_limit), "truncated": total > scan_limit})
 
 
+# ============= FILTER OPTIONS CACHE =============
+# Filter options (with per-value counts) are computed by one $facet aggregation
+# and refreshed in the background, so the SalesOrders filter panel never waits
+# on a collection scan. $facet sub-pipelines cannot use indexes, so only the
+# worker holding the job lease runs it; the result is stored in rollup_state
+# and the other workers load it from there.
+FILTER_OPTIONS_STATE_ID = 'filter_options'
+FILTER_OPTIONS_REFRESH_SECONDS = int(os.getenv('FILTER_OPTIONS_REFRESH_SECONDS', 60))
+ROLLUP_REFRESH_SECONDS = int(os.getenv('ROLLUP_REFRESH_SECONDS', 120))
+SEARCH_KEYS_REFRESH_SECONDS = int(os.getenv('SEARCH_KEYS_REFRESH_SECONDS', 60))
+LINE_ITEMS_REFRESH_SECONDS = int(os.getenv('LINE_ITEMS_REFRESH_SECONDS', 120))
+
+filter_options_cache = {"data": None, "computed_at": None}
+filter_options_lock = threading.Lock()
+
+def compute_filter_options():
+    """Compute status, DCL status and date bucket counts in one aggregation"""
+    facets = {
+        "statuses": [
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}}
+        ],
+        "dcl_statuses": [
+            {"$group": {"_id": "$dcl_status", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}}
+        ]
+    }
+    
+    now = datetime.now()
+    for date_filter in DATE_FILTERS:
+        facets[date_filter["value"]] = [
+            {"$match": {"created_at": get_date_filter_range(date_filter["value"], now)}},
+            {"$count": "count"}
+        ]
+    
+    result = next(sales_orders_collection.aggregate([{"$facet": facets}], **query_options()), {})
+    
+    def value_counts(buckets):
+        # Remove null/empty values
+        return [{"value": b["_id"], "count": b["count"]} for b in buckets if b.get("_id")]
+    
+    def bucket_count(buckets):
+        return buckets[0]["count"] if buckets else 0
+    
+    status_counts = value_counts(result.get("statuses", []))
+    dcl_status_counts = value_counts(result.get("dcl_statuses", []))
+    
+    return {
+        "statuses": [s["value"] for s in status_counts],
+        "dcl_statuses": [s["value"] for s in dcl_status_counts],
+        "status_counts": status_counts,
+        "dcl_status_counts": dcl_status_counts,
+        "date_filters": [
+            {**date_filter, "count": bucket_count(result.get(date_filter["value"], []))}
+            for date_filter in DATE_FILTERS
+        ]
+    }
+
+def refresh_filter_options():
+    """Bring the filter options cache up to date: recompute when stale and leased, else load the shared copy"""
+    state = rollup_state_collection.find_one({"_id": FILTER_OPTIONS_STATE_ID}) or {}
+    data, computed_at = state.get("data"), state.get("computed_at")
+    stale = computed_at is None or datetime.utcnow() - computed_at >= timedelta(seconds=FILTER_OPTIONS_REFRESH_SECONDS)
+    
+    if stale and acquire_job_lease(FILTER_OPTIONS_STATE_ID):
+        try:
+            data, computed_at = compute_filter_options(), datetime.utcnow()
+            rollup_state_collection.update_one(
+                {"_id": FILTER_OPTIONS_STATE_ID},
+                {"$set": {"data": data, "computed_at": computed_at}},
+                upsert=True
+            )
+        finally:
+            release_job_lease(FILTER_OPTIONS_STATE_ID)
+    
+    if data is None:
+        # First run anywhere and another worker is computing it
+        return None
+    with filter_options_lock:
+        filter_options_cache["data"] = data
+        filter_options_cache["computed_at"] = computed_at
+    return data
+
+def run_periodically(name, func, interval_seconds):
+    """Run func forever on a daemon thread, sleeping interval_seconds between runs"""
+    def loop():
+        while True:
+            try:
+                func()
+                logger.debug(f"[CACHE] {name} refreshed")
+            except Exception as e:
+                logger.error(f"[CACHE ERROR] {name} refresh failed: {e}")
+            time.sleep(interval_seconds)
+    
+    threading.Thread(target=loop, name=name, daemon=True).start()
+
 # Add filter options endpoint
 @app.route('/api/sales-orders/filters', methods=['GET'])
+@snapshot_fallback
 def get_sales_orders_filters():
-    """Get available filter options for sales orders"""
+    """Get available filter options for sales orders, with document counts"""
     try:
         if not mongodb_connected or not mongo_client:
             return jsonify({"status": "error", "message": "Database connection failed"}), 500
         
-        # Get unique statuses
-        statuses = sales_orders_collection.distinct("status")
-        dcl_statuses = sales_orders_collection.distinct("dcl_status")
+        with filter_options_lock:
+            filters = filter_options_cache["data"]
+            computed_at = filter_options_cache["computed_at"]
         
-        # Remove null/empty values
-        statuses = [s for s in statuses if s]
-        dcl_statuses = [s for s in dcl_statuses if s]
+        # Cold cache (first request after startup): load the shared copy, or
+        # compute inline if no worker has stored one yet
+        if filters is None:
+            filters = refresh_filter_options()
+            computed_at = filter_options_cache["computed_at"]
+        if filters is None:
+            filters, computed_at = compute_filter_options(), datetime.utcnow()
+        
+        return jsonify({
+            "status": "success",
+            "filters": filters,
+            "computed_at": computed_at.isoformat() if computed_at else None
+        })
         
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
+    except Exception as e:
+        logger.error(f"[API ERROR] Filter options error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ============= ANALYTICS ROLLUPS =============
+# Revenue and order volume are pre-aggregated into one document per
+# (day, currency, location_id, status, dcl_status). The rollup is maintained incrementally:
+# each run finds the days touched by orders updated since the last watermark,
+# recomputes just those days and upserts them with $merge. Deleted orders are
+# taken from the delta sync tombstones; their day is only known when change
+# stream pre-images are enabled, otherwise they stay counted (and a warning is
+# logged) until a full rebuild.
+ROLLUP_STATE_ID = 'sales_daily'
+# Bump when the rollup key changes: the next refresh rebuilds every day
+ROLLUP_SCHEMA_VERSION = 2
+ANALYTICS_INTERVALS = ('day', 'week', 'month')
+ANALYTICS_GROUP_BY = ('currency', 'location_id', 'status', 'dcl_status')
+
+ROLLUP_LEASE_SECONDS = int(os.getenv('ROLLUP_LEASE_SECONDS', 600))
+
+rollup_lock = threading.Lock()
+
+def day_of(field):
+    """Aggregation expression truncating a date field to midnight"""
+    return {"$dateFromParts": {
+        "year": {"$year": field},
+        "month": {"$month": field},
+        "day": {"$dayOfMonth": field}
+    }}
+
+def acquire_job_lease(job_id, lease_seconds=ROLLUP_LEASE_SECONDS):
+    """Claim a background job across processes, so only one worker runs it at a time"""
+    now = datetime.utcnow()
+    try:
+        rollup_state_collection.update_one(
+            {"_id": job_id, "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]},
+            {"$set": {"lease_until": now + timedelta(seconds=lease_seconds), "lease_owner": os.getpid()}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The state document exists and another process holds an unexpired lease
+        return False
+
+def release_job_lease(job_id):
+    rollup_state_collection.update_one(
+        {"_id": job_id, "lease_owner": os.getpid()},
+        {"$unset": {"lease_until": "", "lease_owner": ""}}
+    )
+
+def refresh_daily_rollups(full=False):
+    """Bring the daily rollup collection up to date, returns the number of days recomputed"""
+    with rollup_lock:
+        if not acquire_job_lease(ROLLUP_STATE_ID):
+            logger.debug("[ROLLUP] Another worker holds the rollup lease, skipping")
+            return 0
+        try:
+            return recompute_changed_days(full)
+        finally:
+            release_job_lease(ROLLUP_STATE_ID)
+
+def recompute_changed_days(full):
+    """Recompute the rollup days touched since the watermark (all days if full)"""
+    state = rollup_state_collection.find_one({"_id": ROLLUP_STATE_ID}) or {}
+    full = full or state.get("schema_version") != ROLLUP_SCHEMA_VERSION
+    watermark = None if full else state.get("watermark")
+
+    changed_query = {"created_at": {"$type": "date"}}
+    if watermark:
+        # $gte rather than $gt: recomputing a day twice is harmless, missing one is not
+        changed_query["updated_at"] = {"$gte": watermark}
+
+    # Which days do the changed orders belong to?
+    changed = list(sales_orders_collection.aggregate([
+        {"$match": changed_query},
+        {"$group": {"_id": day_of("$created_at"), "max_updated_at": {"$max": "$updated_at"}}}
+    ], **query_options()))
+
+    # ...and the deleted ones, from their tombstones
+    tombstones = deleted_orders_after(state.get("tombstone_watermark"), state.get("tombstone_watermark_id"))
+    deleted_days = {
+        datetime(t["created_at"].year, t["created_at"].month, t["created_at"].day)
+        for t in tombstones if isinstance(t.get("created_at"), datetime)
+    }
+    unknown_days = sum(1 for t in tombstones if not isinstance(t.get("created_at"), datetime))
+    if unknown_days:
+        logger.warning(f"[ROLLUP] {unknown_days} deleted order(s) without a pre-image stay counted in the rollups")
+    # Saved with the order watermark once the days are recomputed, so a failed
+    # run applies the same deletions again
+    progress = {}
+    if tombstones:
+        progress = {"tombstone_watermark": tombstones[-1]["updated_at"], "tombstone_watermark_id": tombstones[-1]["_id"]}
+    if not changed and not deleted_days:
+        if progress:
+            rollup_state_collection.update_one({"_id": ROLLUP_STATE_ID}, {"$set": progress}, upsert=True)
+        return 0
+
+    days = sorted({c["_id"] for c in changed} | deleted_days)
+    seen = [c["max_updated_at"] for c in changed if isinstance(c.get("max_updated_at"), datetime)]
+    new_watermark = max(seen + ([watermark] if watermark else []), default=None)
+    refreshed_at = datetime.utcnow()
+
+    for day in days:
+        sales_orders_collection.aggregate([
+            {"$match": {"created_at": {"$gte": day, "$lt": day + timedelta(days=1)}}},
+            {"$group": {
+                "_id": {
+                    "day": day_of("$created_at"),
+                    "currency": {"$ifNull": ["$katana_order_data.currency", "USD"]},
+                    "location_id": "$katana_order_data.location_id",
+                    "status": "$status",
+                    "dcl_status": "$dcl_status"
+                },
+                "revenue": {"$sum": {"$convert": {
+                    "input": "$katana_order_data.total", "to": "double", "onError": 0, "onNull": 0
+                }}},
+                "orders": {"$sum": 1}
+            }},
+            {"$project": {
+                "_id": 1,
+                "day": "$_id.day",
+                "currency": "$_id.currency",
+                "location_id": "$_id.location_id",
+                "status": "$_id.status",
+                "dcl_status": "$_id.dcl_status",
+                "revenue": 1,
+                "orders": 1,
+                "refreshed_at": {"$literal": refreshed_at}
+            }},
+            {"$merge": {"into": DAILY_ROLLUPS_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ], **query_options())
+
+    # Buckets on recomputed days that were not rewritten no longer have any orders
+    daily_rollups_collection.delete_many({"day": {"$in": days}, "refreshed_at": {"$lt": refreshed_at}})
+
+    rollup_state_collection.update_one(
+        {"_id": ROLLUP_STATE_ID},
+        {"$set": {"watermark": new_watermark, "refreshed_at": refreshed_at, "schema_version": ROLLUP_SCHEMA_VERSION, **progress}},
+        upsert=True
+    )
+    logger.info(f"[ROLLUP] Recomputed {len(days)} day(s), watermark={new_watermark}")
+    return len(days)
+
+def period_of(interval):
+    """Aggregation expression mapping a rollup day to the start of its period"""
+    if interval == 'week':
+        return {"$dateFromParts": {"isoWeekYear": {"$isoWeekYear": "$day"}, "isoWeek": {"$isoWeek": "$day"}}}
+    if interval == 'month':
+        return {"$dateFromParts": {"year": {"$year": "$day"}, "month": {"$month": "$day"}}}
+    return "$day"
+
+@app.route('/api/analytics/timeseries', methods=['GET'])
+def get_analytics_timeseries():
+    """Get revenue and order volume series by day, week or month from the daily rollups"""
+    try:
+        if not mongodb_connected or not mongo_client:
+            return jsonify({"status": "error", "message": "Database connection failed"}), 500
+
+        interval = request.args.get('interval', 'day')
+        group_by = request.args.get('group_by', '')
+        if interval not in ANALYTICS_INTERVALS:
+            return jsonify({"status": "error", "message": f"interval must be one of {', '.join(ANALYTICS_INTERVALS)}"}), 400
+        if group_by and group_by not in ANALYTICS_GROUP_BY:
+            return jsonify({"status": "error", "message": f"group_by must be one of {', '.join(ANALYTICS_GROUP_BY)}"}), 400
+
+        # Default to the last year
+        end_dt = datetime.utcnow()
+        start_dt = end_dt - timedelta(days=365)
+        try:
+            if request.args.get('start_date'):
+                start_dt = parse_iso_utc(request.args['start_date'])
+            if request.args.get('end_date'):
+                end_dt = parse_iso_utc(request.args['end_date'])
+        except ValueError:
+            return jsonify({"status": "error", "message": "Invalid date format"}), 400
+
+        query = {"day": {"$gte": start_dt.replace(hour=0, minute=0, second=0, microsecond=0), "$lte": end_dt}}
+
+        # Optional filters on the breakdown dimensions
+        if request.args.get('currency'):
+            query['currency'] = request.args['currency']
+        if request.args.get('status'):
+            query['status'] = request.args['status']
+        if request.args.get('dcl_status'):
+            query['dcl_status'] = request.args['dcl_status']
+        if request.args.get('location_id'):
+            try:
+                query['location_id'] = int(request.args['location_id'])
+            except ValueError:
+                query['location_id'] = request.args['location_id']
+
+        # Revenue is never summed across currencies: it is always grouped by
+        # currency too, and reported per currency in revenue_by_currency
+        group_key = {"period": period_of(interval), "currency": "$currency"}
+        if group_by:
+            group_key[group_by] = f"${group_by}"
+
+        buckets = daily_rollups_collection.aggregate([
+            {"$match": query},
+            {"$group": {"_id": group_key, "revenue": {"$sum": "$revenue"}, "orders": {"$sum": "$orders"}}},
+            {"$sort": {"_id.period": 1}}
+        ], **query_options())
+
+        points = {}
+        for bucket in buckets:
+            period = bucket["_id"]["period"].strftime('%Y-%m-%d')
+            group = bucket["_id"].get(group_by) if group_by else None
+            point = points.setdefault((period, str(group)), {"period": period, "orders": 0, "revenue_by_currency": {}})
+            if group_by:
+                point[group_by] = group
+            point["orders"] += bucket["orders"]
+            currency = bucket["_id"]["currency"]
+            point["revenue_by_currency"][currency] = round(point["revenue_by_currency"].get(currency, 0) + bucket["revenue"], 2)
+
+        series = list(points.values())
+        for point in series:
+            # A single total only where it is meaningful: one currency in the point
+            revenues = list(point["revenue_by_currency"].values())
+            point["revenue"] = revenues[0] if len(revenues) == 1 else None
+
+        state = rollup_state_collection.find_one({"_id": ROLLUP_STATE_ID}) or {}
+
         return jsonify({
             "status": "success",
-            "filters": {
-                "statuses": statuses,
-                "dcl_statuses": dcl_statuses,
-                "date_filters": [
-                    {"value": "today", "label": "Today"},
-                    {"value": "yesterday", "label": "Yesterday"},
-                    {"value": "last_7_days", "label": "Last 7 Days"},
-                    {"value": "last_30_days", "label": "Last 30 Days"}
+            "interval": interval,
+            "group_by": group_by or None,
+            "data": series,
+            "rollup_refreshed_at": state["refreshed_at"].isoformat() if state.get("refreshed_at") else None
+        })
+
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
+    except Exception as e:
+        logger.error(f"[API ERROR] Analytics timeseries error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/analytics/rollups/refresh', methods=['POST'])
+def refresh_analytics_rollups():
+    """Bring the daily rollups up to date now (full=true rebuilds every day)"""
+    try:
+        if not mongodb_connected or not mongo_client:
+            return jsonify({"status": "error", "message": "Database connection failed"}), 500
+
+        full = request.args.get('full', '').lower() == 'true'
+        days = refresh_daily_rollups(full=full)
+        return jsonify({"status": "success", "days_recomputed": days, "full": full})
+
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
+    except Exception as e:
+        logger.error(f"[API ERROR] Rollup refresh error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ============= LINE ITEM ANALYTICS =============
+# sales_order_rows are unwound into sales_order_lines, one document per row,
+# so product reports group over a flat indexed collection instead of
+# unwinding every order's embedded array per request. Like the daily rollups,
+# the view is refreshed incrementally from the orders' updated_at watermark.
+LINE_ITEMS_STATE_ID = 'sales_order_lines'
+LINE_ITEMS_BATCH_SIZE = int(os.getenv('LINE_ITEMS_BATCH_SIZE', 1000))
+LINE_ITEMS_SLICE_SECONDS = ROLLUP_LEASE_SECONDS // 2
+VARIANT_SORT_METRICS = {'revenue': 'revenue', 'units': 'units', 'orders': 'orders', 'lines': 'lines'}
+
+line_items_lock = threading.Lock()
+
+def refresh_line_items(full=False):
+    """Re-materialize the line items of orders changed since the watermark"""
+    with line_items_lock:
+        if not acquire_job_lease(LINE_ITEMS_STATE_ID):
+            return 0
+        try:
+            return rematerialize_changed_orders(full)
+        finally:
+            release_job_lease(LINE_ITEMS_STATE_ID)
+
+def rematerialize_changed_orders(full):
+    """Rematerialize orders in chunks of LINE_ITEMS_BATCH_SIZE, saving progress after each.
+    
+    A full build (the first one, or full=True) walks every order by _id; after
+    it, orders are walked by (updated_at, _id) from the watermark. Each run
+    stops after LINE_ITEMS_SLICE_SECONDS and the next one resumes, so a build
+    over millions of orders neither outlives the job lease nor starts over.
+    """
+    state = rollup_state_collection.find_one({"_id": LINE_ITEMS_STATE_ID}) or {}
+    build = state.get("full_build")
+    if full or (build is None and "watermark" not in state):
+        # Orders updated while the build runs are picked up from this position afterwards
+        latest = next(budgeted(sales_orders_collection.find({"updated_at": {"$type": "date"}}, {"updated_at": 1})
+                               .sort([("updated_at", -1), ("_id", -1)]).limit(1)), None)
+        build = {
+            "started_at": datetime.utcnow(),
+            "after_id": None,
+            "watermark": latest["updated_at"] if latest else None,
+            "watermark_id": latest["_id"] if latest else None
+        }
+        save_line_items_state({"full_build": build})
+
+    deadline = time.monotonic() + LINE_ITEMS_SLICE_SECONDS
+    if build is not None:
+        return continue_full_build(build, deadline)
+
+    # Lines of deleted orders
+    tombstones = deleted_orders_after(state.get("tombstone_watermark"), state.get("tombstone_watermark_id"))
+    if tombstones:
+        line_items_collection.delete_many({"order_id": {"$in": [t["_id"] for t in tombstones]}})
+        save_line_items_state({"tombstone_watermark": tombstones[-1]["updated_at"], "tombstone_watermark_id": tombstones[-1]["_id"]})
+        logger.info(f"[LINE ITEMS] Removed the lines of {len(tombstones)} deleted order(s)")
+
+    since, since_id = state.get("watermark"), state.get("watermark_id")
+    orders = 0
+    while time.monotonic() < deadline:
+        changed = list(budgeted(sales_orders_collection.find(changed_after(since, since_id), {"updated_at": 1})
+                                .sort([("updated_at", 1), ("_id", 1)])
+                                .hint(SALES_ORDER_CHANGES_INDEX)
+                                .limit(LINE_ITEMS_BATCH_SIZE)))
+        if not changed:
+            break
+        rematerialize_orders([order["_id"] for order in changed])
+        since, since_id = changed[-1]["updated_at"], changed[-1]["_id"]
+        save_line_items_state({"watermark": since, "watermark_id": since_id})
+        orders += len(changed)
+
+    if orders:
+        logger.info(f"[LINE ITEMS] Rematerialized {orders} order(s), watermark={since}")
+    return orders
+
+def continue_full_build(build, deadline):
+    orders = 0
+    while time.monotonic() < deadline:
+        query = {"_id": {"$gt": build["after_id"]}} if build["after_id"] is not None else {}
+        ids = [order["_id"] for order in budgeted(sales_orders_collection.find(query, {"_id": 1})
+                                                  .sort("_id", 1).limit(LINE_ITEMS_BATCH_SIZE))]
+        if not ids:
+            # Every existing order was rewritten after started_at: older lines belong to deleted orders
+            line_items_collection.delete_many({"refreshed_at": {"$lt": build["started_at"]}})
+            rollup_state_collection.update_one(
+                {"_id": LINE_ITEMS_STATE_ID},
+                {"$set": {"watermark": build["watermark"], "watermark_id": build["watermark_id"], "refreshed_at": datetime.utcnow()},
+                 "$unset": {"full_build": ""}}
+            )
+            logger.info(f"[LINE ITEMS] Full build finished, watermark={build['watermark']}")
+            return orders
+        rematerialize_orders(ids)
+        build["after_id"] = ids[-1]
+        save_line_items_state({"full_build": build})
+        orders += len(ids)
+
+    logger.info(f"[LINE ITEMS] Full build in progress, {orders} order(s) this run, resuming after {build['after_id']}")
+    return orders
+
+def save_line_items_state(fields):
+    rollup_state_collection.update_one(
+        {"_id": LINE_ITEMS_STATE_ID},
+        {"$set": {**fields, "refreshed_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+def rematerialize_orders(order_ids):
+    """Rewrite the line items of the given orders and drop their removed rows"""
+    refreshed_at = datetime.utcnow()
+    sales_orders_collection.aggregate([
+        {"$match": {"_id": {"$in": order_ids}, "katana_order_data.sales_order_rows": {"$type": "array"}}},
+        {"$unwind": {"path": "$katana_order_data.sales_order_rows", "includeArrayIndex": "row_index"}},
+        {"$project": {
+            "_id": {"$concat": [{"$toString": "$_id"}, ":", {"$toString": "$row_index"}]},
+            "order_id": "$_id",
+            "order_number": "$katana_order_number",
+            "status": "$status",
+            "dcl_status": "$dcl_status",
+            "currency": {"$ifNull": ["$katana_order_data.currency", "USD"]},
+            "location_id": "$katana_order_data.location_id",
+            "created_at": "$created_at",
+            "variant_id": "$katana_order_data.sales_order_rows.variant_id",
+            "sku": "$katana_order_data.sales_order_rows.sku",
+            "quantity": {"$convert": {"input": "$katana_order_data.sales_order_rows.quantity", "to": "double", "onError": 0, "onNull": 0}},
+            "price_per_unit": {"$convert": {"input": "$katana_order_data.sales_order_rows.price_per_unit", "to": "double", "onError": 0, "onNull": 0}},
+            "total": {"$convert": {"input": "$katana_order_data.sales_order_rows.total", "to": "double", "onError": 0, "onNull": 0}},
+            "refreshed_at": {"$literal": refreshed_at}
+        }},
+        {"$merge": {"into": LINE_ITEMS_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ], **query_options())
+
+    # Rows of these orders that were not rewritten have been removed from the order
+    line_items_collection.delete_many({"order_id": {"$in": order_ids}, "refreshed_at": {"$lt": refreshed_at}})
+
+@app.route('/api/analytics/variants', methods=['GET'])
+def get_variant_analytics():
+    """Get top variants by revenue, units, orders or lines from the line item view.
+    
+    Revenue is reported per currency; a single revenue figure (and sorting by
+    it) needs a currency filter.
+    """
+    try:
+        if not mongodb_connected or not mongo_client:
+            return jsonify({"status": "error", "message": "Database connection failed"}), 500
+
+        currency = request.args.get('currency', '')
+        sort_by = request.args.get('sort_by', 'revenue' if currency else 'units')
+        if sort_by not in VARIANT_SORT_METRICS:
+            return jsonify({"status": "error", "message": f"sort_by must be one of {', '.join(VARIANT_SORT_METRICS)}"}), 400
+        if sort_by == 'revenue' and not currency:
+            return jsonify({"status": "error", "message": "sort_by=revenue needs a currency filter"}), 400
+        limit = page_limit(20)
+
+        query = {}
+        date_range = get_date_filter_range(request.args.get('date_filter', ''))
+        try:
+            if request.args.get('start_date') and request.args.get('end_date'):
+                date_range = {
+                    '$gte': parse_iso_utc(request.args['start_date']),
+                    '$lte': parse_iso_utc(request.args['end_date'])
+                }
+        except ValueError:
+            return jsonify({"status": "error", "message": "Invalid date format"}), 400
+        if date_range:
+            query['created_at'] = date_range
+        for field in ('currency', 'status', 'dcl_status'):
+            if request.args.get(field):
+                query[field] = request.args[field]
+
+        # Lines are first grouped per order, so "orders" counts distinct orders
+        # (an order has one currency, so per-currency order counts add up)
+        result = next(line_items_collection.aggregate([
+            {"$match": query},
+            {"$facet": {
+                "variants": [
+                    {"$group": {
+                        "_id": {"variant_id": "$variant_id", "currency": "$currency", "order_id": "$order_id"},
+                        "sku": {"$max": "$sku"},
+                        "units": {"$sum": "$quantity"},
+                        "revenue": {"$sum": "$total"},
+                        "lines": {"$sum": 1},
+                        "price_sum": {"$sum": "$price_per_unit"}
+                    }},
+                    {"$group": {
+                        "_id": {"variant_id": "$_id.variant_id", "currency": "$_id.currency"},
+                        "sku": {"$max": "$sku"},
+                        "units": {"$sum": "$units"},
+                        "revenue": {"$sum": "$revenue"},
+                        "lines": {"$sum": "$lines"},
+                        "orders": {"$sum": 1},
+                        "price_sum": {"$sum": "$price_sum"}
+                    }},
+                    {"$group": {
+                        "_id": "$_id.variant_id",
+                        "sku": {"$max": "$sku"},
+                        "units": {"$sum": "$units"},
+                        "lines": {"$sum": "$lines"},
+                        "orders": {"$sum": "$orders"},
+                        # Only meaningful with a currency filter, where there is one currency
+                        "revenue": {"$sum": "$revenue"},
+                        "by_currency": {"$push": {
+                            "currency": "$_id.currency",
+                            "revenue": "$revenue",
+                            "avg_price_per_unit": {"$divide": ["$price_sum", "$lines"]}
+                        }}
+                    }},
+                    {"$sort": {VARIANT_SORT_METRICS[sort_by]: -1}},
+                    {"$limit": limit}
+                ],
+                "totals": [
+                    {"$group": {
+                        "_id": {"currency": "$currency", "order_id": "$order_id"},
+                        "units": {"$sum": "$quantity"},
+                        "revenue": {"$sum": "$total"},
+                        "lines": {"$sum": 1}
+                    }},
+                    {"$group": {
+                        "_id": "$_id.currency",
+                        "units": {"$sum": "$units"},
+                        "revenue": {"$sum": "$revenue"},
+                        "lines": {"$sum": "$lines"},
+                        "orders": {"$sum": 1}
+                    }}
                 ]
+            }}
+        ], **query_options()), {})
+
+        variants = []
+        for v in result.get("variants", []):
+            variant = {
+                "variant_id": v["_id"],
+                "sku": v.get("sku"),
+                "units": v["units"],
+                "orders": v["orders"],
+                "lines": v["lines"],
+                "revenue_by_currency": {c["currency"]: round(c["revenue"], 2) for c in v["by_currency"]},
+                "avg_price_per_unit_by_currency": {c["currency"]: round(c["avg_price_per_unit"] or 0, 2) for c in v["by_currency"]},
+                "revenue": None,
+                "avg_price_per_unit": None
+            }
+            if currency:
+                variant["revenue"] = variant["revenue_by_currency"].get(currency, 0)
+                variant["avg_price_per_unit"] = variant["avg_price_per_unit_by_currency"].get(currency, 0)
+            variants.append(variant)
+
+        totals_by_currency = result.get("totals", [])
+        revenue_by_currency = {t["_id"]: round(t["revenue"], 2) for t in totals_by_currency}
+
+        state = rollup_state_collection.find_one({"_id": LINE_ITEMS_STATE_ID}) or {}
+
+        return jsonify({
+            "status": "success",
+            "sort_by": sort_by,
+            "data": variants,
+            "totals": {
+                "units": sum(t["units"] for t in totals_by_currency),
+                "orders": sum(t["orders"] for t in totals_by_currency),
+                "lines": sum(t["lines"] for t in totals_by_currency),
+                "revenue_by_currency": revenue_by_currency,
+                "revenue": revenue_by_currency.get(currency, 0) if currency else None
+            },
+            "refreshed_at": state["refreshed_at"].isoformat() if state.get("refreshed_at") else None
+        })
+
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
+    except Exception as e:
+        logger.error(f"[API ERROR] Variant analytics error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ============= STATUS DISTRIBUTION =============
+# The status x DCL status matrix. Without a window it is summed from the daily
+# rollups (the incrementally maintained counter cache), so its cost does not
+# grow with the number of orders. With a created_at window it is one $group
+# over STATUS_DISTRIBUTION_INDEX that never touches the documents.
+def status_matrix_from_rollups():
+    return daily_rollups_collection.aggregate([
+        {"$group": {"_id": {"status": "$status", "dcl_status": "$dcl_status"}, "count": {"$sum": "$orders"}}}
+    ], **query_options())
+
+def status_matrix_from_index(window):
+    return sales_orders_collection.aggregate([
+        {"$match": {"created_at": window}},
+        {"$project": {"_id": 0, "status": 1, "dcl_status": 1}},
+        {"$group": {"_id": {"status": "$status", "dcl_status": "$dcl_status"}, "count": {"$sum": 1}}}
+    ], hint=STATUS_DISTRIBUTION_INDEX, **query_options())
+
+@app.route('/api/status-distribution', methods=['GET'])
+@snapshot_fallback
+@single_flight
+def get_status_distribution():
+    """Get order counts for every status x DCL status pair, optionally windowed by created_at"""
+    try:
+        if not mongodb_connected or not mongo_client:
+            return jsonify({"status": "error", "message": "Database connection failed"}), 500
+        
+        date_filter = request.args.get('date_filter', '')
+        start_date = request.args.get('start_date', '')
+        end_date = request.args.get('end_date', '')
+        
+        window = get_date_filter_range(date_filter)
+        if start_date and end_date:
+            try:
+                window = {'$gte': parse_iso_utc(start_date), '$lte': parse_iso_utc(end_date)}
+            except ValueError:
+                return jsonify({"status": "error", "message": "Invalid date format"}), 400
+        
+        if window:
+            buckets = status_matrix_from_index(window)
+            source = "index"
+        else:
+            buckets = status_matrix_from_rollups()
+            source = "rollups"
+        
+        matrix = []
+        by_status = {}
+        by_dcl_status = {}
+        for bucket in buckets:
+            status = bucket["_id"].get("status") or "unknown"
+            dcl_status = bucket["_id"].get("dcl_status") or "unknown"
+            count = bucket["count"]
+            if not count:
+                continue
+            matrix.append({"status": status, "dcl_status": dcl_status, "count": count})
+            by_status[status] = by_status.get(status, 0) + count
+            by_dcl_status[dcl_status] = by_dcl_status.get(dcl_status, 0) + count
+        
+        matrix.sort(key=lambda cell: cell["count"], reverse=True)
+        
+        return jsonify({
+            "status": "success",
+            "data": matrix,
+            "totals": {
+                "by_status": by_status,
+                "by_dcl_status": by_dcl_status,
+                "total": sum(by_status.values())
+            },
+            "source": source,
+            "filters_applied": {
+                "date_filter": date_filter,
+                "start_date": start_date,
+                "end_date": end_date
             }
         })
         
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
     except Exception as e:
-        logger.error(f"[API ERROR] Filter options error: {e}")
+        logger.error(f"[API ERROR] Status distribution error: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# ============= UNIFIED ORDER SEARCH =============
+# One identifier, four collections. Order, PO and transfer numbers are
+# normalized (upper case, alphanumerics only) into a compact search_keys
+# collection with a multikey index on "keys", maintained incrementally from
+# each collection's updated_at watermark. A search is one prefix lookup on that
+# index, followed by concurrent _id/number lookups in the four collections.
+SEARCH_KEYS_STATE_ID = 'search_keys'
+SEARCH_KEYS_BATCH_SIZE = 1000
+SEARCH_KEYS_SLICE_SECONDS = ROLLUP_LEASE_SECONDS // 2
+SEARCH_MIN_LENGTH = 2
+
+# Per collection: the human-facing number, other identifiers, and the date
+# used to place the document on the timeline
+SEARCH_SOURCES = {
+    'sales_orders': {"label": "Sales Order", "number": "katana_order_number", "ids": ["katana_order_id"], "date": "created_at"},
+    'target_orders': {"label": "Target Order", "number": "order_no", "ids": ["katana_order_id"], "date": "created_at"},
+    'stock_transfers': {"label": "Stock Transfer", "number": "stock_transfer_number", "ids": ["id"], "date": "transfer_date"},
+    'purchase_orders': {"label": "Purchase Order", "number": "po_number", "ids": ["po_id"], "date": "date"}
+}
+
+# Enough lookup threads for every request thread of the worker to search at once
+search_executor = ThreadPoolExecutor(
+    max_workers=len(SEARCH_SOURCES) * int(os.getenv('GUNICORN_THREADS', 8)),
+    thread_name_prefix="search"
+)
+
+def search_collections():
+    return {
+        'sales_orders': sales_orders_collection,
+        'target_orders': target_orders_collection,
+        'stock_transfers': stock_transfers_collection,
+        'purchase_orders': purchase_orders_collection
+    }
+
+def normalize_search_key(value):
+    """'so-0012 ' -> 'SO0012'"""
+    return re.sub(r'[^0-9A-Za-z]', '', str(value)).upper()
+
+def search_keys_for(doc, source):
+    keys = set()
+    for field in [source["number"]] + source["ids"]:
+        if doc.get(field) not in (None, ''):
+            key = normalize_search_key(doc[field])
+            if key:
+                keys.add(key)
+    return sorted(keys)
+
+def as_iso(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def refresh_search_keys(full=False):
+    """Index the search keys of documents changed since each collection's watermark.
+    
+    Like the line items, a collection without a watermark (or full=True) is
+    first walked by _id, then by (updated_at, _id). Each run stops after
+    SEARCH_KEYS_SLICE_SECONDS and the next one resumes from the saved position.
+    """
+    if not acquire_job_lease(SEARCH_KEYS_STATE_ID):
+        return 0
+    try:
+        state = rollup_state_collection.find_one({"_id": SEARCH_KEYS_STATE_ID}) or {}
+        builds = state.get("full_builds", {})
+        watermarks = state.get("watermarks", {})
+        watermark_ids = state.get("watermark_ids", {})
+        deadline = time.monotonic() + SEARCH_KEYS_SLICE_SECONDS
+        indexed = 0
+
+        for name, collection in search_collections().items():
+            source = SEARCH_SOURCES[name]
+            projection = {field: 1 for field in [source["number"], source["date"], "updated_at"] + source["ids"]}
+            if full or (name not in builds and name not in watermarks):
+                # Documents updated while the build runs are picked up from this position afterwards
+                latest = next(budgeted(collection.find({"updated_at": {"$type": "date"}}, {"updated_at": 1})
+                                       .sort([("updated_at", -1), ("_id", -1)]).limit(1)), None)
+                builds[name] = {
+                    "after_id": None,
+                    "watermark": latest["updated_at"] if latest else None,
+                    "watermark_id": latest["_id"] if latest else None
+                }
+                save_search_keys_state({f"full_builds.{name}": builds[name]})
+
+            while time.monotonic() < deadline:
+                build = builds.get(name)
+                if build is not None:
+                    query = {"_id": {"$gt": build["after_id"]}} if build["after_id"] is not None else {}
+                    docs = list(budgeted(collection.find(query, projection).sort("_id", 1).limit(SEARCH_KEYS_BATCH_SIZE)))
+                else:
+                    query = changed_after(watermarks.get(name), watermark_ids.get(name))
+                    docs = list(budgeted(collection.find(query, projection)
+                                         .sort([("updated_at", 1), ("_id", 1)])
+                                         .limit(SEARCH_KEYS_BATCH_SIZE)))
+
+                if not docs:
+                    if build is None:
+                        break
+                    watermarks[name], watermark_ids[name] = build["watermark"], build["watermark_id"]
+                    del builds[name]
+                    save_search_keys_state(
+                        {f"watermarks.{name}": watermarks[name], f"watermark_ids.{name}": watermark_ids[name]},
+                        unset=f"full_builds.{name}"
+                    )
+                    continue
+
+                search_keys_collection.bulk_write([UpdateOne(
+                    {"_id": f"{name}:{doc['_id']}"},
+                    {"$set": {"collection": name, "doc_id": doc["_id"], "keys": search_keys_for(doc, source)}},
+                    upsert=True
+                ) for doc in docs], ordered=False)
+                indexed += len(docs)
+
+                # Saved with every batch, so the next run resumes where this one stopped
+                if build is not None:
+                    build["after_id"] = docs[-1]["_id"]
+                    save_search_keys_state({f"full_builds.{name}": build})
+                else:
+                    watermarks[name], watermark_ids[name] = docs[-1]["updated_at"], docs[-1]["_id"]
+                    save_search_keys_state({f"watermarks.{name}": watermarks[name], f"watermark_ids.{name}": watermark_ids[name]})
+
+        if indexed:
+            logger.info(f"[SEARCH] Indexed {indexed} document(s)")
+        if builds:
+            logger.info(f"[SEARCH] Build in progress for {', '.join(builds)}, resuming next run")
+        return indexed
+    finally:
+        release_job_lease(SEARCH_KEYS_STATE_ID)
+
+def save_search_keys_state(fields, unset=None):
+    update = {"$set": {**fields, "refreshed_at": datetime.utcnow()}}
+    if unset:
+        update["$unset"] = {unset: ""}
+    rollup_state_collection.update_one({"_id": SEARCH_KEYS_STATE_ID}, update, upsert=True)
+
+def timeline_entry(name, doc):
+    source = SEARCH_SOURCES[name]
+    return {
+        "collection": name,
+        "type": source["label"],
+        "id": str(doc["_id"]),
+        "number": doc.get(source["number"]),
+        "status": doc.get("status"),
+        "date": as_iso(doc.get(source["date"]) or doc.get("created_at")),
+        "created_at": as_iso(doc.get("created_at")),
+        "updated_at": as_iso(doc.get("updated_at"))
+    }
+
+@app.route('/api/search', methods=['GET'])
+def search_orders():
+    """Find an order, PO or transfer by number in every collection, as one timeline"""
+    try:
+        if not mongodb_connected or not mongo_client:
+            return jsonify({"status": "error", "message": "Database connection failed"}), 500
+
+        q = request.args.get('q', '').strip()
+        key = normalize_search_key(q)
+        limit = page_limit(50)
+        if len(key) < SEARCH_MIN_LENGTH:
+            return jsonify({"status": "error", "message": f"Search term must have at least {SEARCH_MIN_LENGTH} letters or digits"}), 400
+
+        # Anchored prefix regex on the normalized keys: an index range scan
+        hits = budgeted(search_keys_collection.find(
+            {"keys": {"$regex": f"^{re.escape(key)}"}},
+            {"collection": 1, "doc_id": 1}
+        ).limit(limit))
+        ids_by_collection = {name: [] for name in SEARCH_SOURCES}
+        for hit in hits:
+            ids_by_collection[hit["collection"]].append(hit["doc_id"])
+
+        # Documents changed since the last search key refresh are caught by an
+        # exact match on their own (indexed) number field
+        # Lookups run without a request context: budget and cancellation tag are passed in
+        collections = search_collections()
+        budget_ms = query_budget_ms()
+        query_tag = g.query_tag
+
+        def lookup(name):
+            source = SEARCH_SOURCES[name]
+            query = {"$or": [{"_id": {"$in": ids_by_collection[name]}}, {source["number"]: q}]}
+            cursor = collections[name].find(query).limit(limit).max_time_ms(budget_ms).comment(query_tag)
+            return name, list(cursor)
+
+        timeline = []
+        for name, docs in search_executor.map(lookup, SEARCH_SOURCES):
+            timeline.extend(timeline_entry(name, doc) for doc in docs)
+
+        timeline.sort(key=lambda entry: str(entry["date"] or ""))
+
+        return jsonify({
+            "status": "success",
+            "query": q,
+            "normalized": key,
+            "data": timeline,
+            "count": len(timeline)
+        })
+
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
+    except Exception as e:
+        logger.error(f"[API ERROR] Search error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ============= DCL FAILURE DRILL-DOWN =============
+# Failed DCL submissions are a tiny fraction of the collection, so they get a
+# partial index (DCL_FAILURES_INDEX) holding only those documents. Reasons are
+# grouped in MongoDB per raw message and day, then merged here after
+# normalizing away order numbers, ids and other per-order noise.
+DCL_FAILED_QUERY = {"dcl_result.success": False}
+DCL_FAILURE_SAMPLES = 5
+
+# First of the places DCL puts an error message, as a string
+DCL_REASON_EXPR = {"$convert": {
+    "input": {"$ifNull": ["$dcl_result.error", {"$ifNull": ["$dcl_result.error_message", {"$ifNull": [
+        "$dcl_result.message", {"$ifNull": [
+            {"$arrayElemAt": ["$dcl_result.errors.message", 0]},
+            {"$arrayElemAt": ["$dcl_result.errors", 0]}
+        ]}
+    ]}]}]},
+    "to": "string",
+    "onError": "unreadable error",
+    "onNull": "unknown"
+}}
+
+def normalize_failure_reason(reason):
+    """'Order #SO-1042 rejected: SKU 55512 not found' -> 'order # rejected: sku # not found'"""
+    reason = re.sub(r'"[^"]*"|\'[^\']*\'', '"..."', reason.lower())
+    reason = re.sub(r'#*\b[a-z]*-?\d[\w-]*', '#', reason)
+    return re.sub(r'\s+', ' ', reason).strip() or 'unknown'
+
+@app.route('/api/dcl-failures', methods=['GET'])
+@single_flight
+def get_dcl_failures():
+    """Get failed DCL submissions grouped by normalized reason, per day, with sample orders"""
+    try:
+        if not mongodb_connected or not mongo_client:
+            return jsonify({"status": "error", "message": "Database connection failed"}), 500
+
+        date_filter = request.args.get('date_filter', 'last_7_days')
+        limit = page_limit(20)
+
+        window = get_date_filter_range(date_filter)
+        if request.args.get('start_date') and request.args.get('end_date'):
+            try:
+                window = {
+                    '$gte': parse_iso_utc(request.args['start_date']),
+                    '$lte': parse_iso_utc(request.args['end_date'])
+                }
+            except ValueError:
+                return jsonify({"status": "error", "message": "Invalid date format"}), 400
+
+        query = dict(DCL_FAILED_QUERY)
+        if window:
+            query['created_at'] = window
+
+        buckets = sales_orders_collection.aggregate([
+            {"$match": query},
+            {"$group": {
+                "_id": {
+                    "reason": DCL_REASON_EXPR,
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+                },
+                "count": {"$sum": 1},
+                "first_seen": {"$min": "$created_at"},
+                "last_seen": {"$max": "$created_at"},
+                # Bounded per group, unlike $push + $slice, so a failure burst cannot exhaust $group memory (MongoDB 5.2+)
+                "samples": {"$firstN": {"input": "$katana_order_number", "n": DCL_FAILURE_SAMPLES}}
+            }}
+        ], hint=DCL_FAILURES_INDEX, **query_options())
+
+        reasons = {}
+        for bucket in buckets:
+            raw = bucket["_id"]["reason"]
+            day = bucket["_id"]["day"]
+            reason = reasons.setdefault(normalize_failure_reason(raw), {
+                "count": 0, "first_seen": None, "last_seen": None, "by_day": {}, "examples": [], "sample_orders": []
+            })
+            reason["count"] += bucket["count"]
+            if day:
+                reason["by_day"][day] = reason["by_day"].get(day, 0) + bucket["count"]
+            if bucket.get("first_seen") and (reason["first_seen"] is None or bucket["first_seen"] < reason["first_seen"]):
+                reason["first_seen"] = bucket["first_seen"]
+            if bucket.get("last_seen") and (reason["last_seen"] is None or bucket["last_seen"] > reason["last_seen"]):
+                reason["last_seen"] = bucket["last_seen"]
+            if len(reason["examples"]) < 3 and raw not in reason["examples"]:
+                reason["examples"].append(raw)
+            for order_number in bucket["samples"]:
+                if len(reason["sample_orders"]) < DCL_FAILURE_SAMPLES and order_number not in reason["sample_orders"]:
+                    reason["sample_orders"].append(order_number)
+
+        grouped = sorted(
+            ({"reason": name, **details} for name, details in reasons.items()),
+            key=lambda r: r["count"],
+            reverse=True
+        )
+        for reason in grouped:
+            reason["first_seen"] = as_iso(reason["first_seen"])
+            reason["last_seen"] = as_iso(reason["last_seen"])
+
+        return jsonify({
+            "status": "success",
+            "data": grouped[:limit],
+            "total_failures": sum(r["count"] for r in grouped),
+            "distinct_reasons": len(grouped),
+            "filters_applied": {
+                "date_filter": date_filter,
+                "start_date": request.args.get('start_date', ''),
+                "end_date": request.args.get('end_date', '')
+            }
+        })
+
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
+    except Exception as e:
+        logger.error(f"[API ERROR] DCL failures error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ============= DELTA SYNC =============
+# Clients keep an order table current by asking only for what changed after
+# their watermark: the (updated_at, _id) of the last change they applied.
+# Changed orders are read from SALES_ORDER_CHANGES_INDEX. Deleted orders leave
+# no document behind, so a change stream records them as tombstones ordered on
+# the same (updated_at, _id) key. A tombstone's updated_at is the time it was
+# written, not the time of the deletion: the watcher can run behind, and a
+# tombstone stamped in the past could land behind watermarks already handed
+# out. Tombstones expire after ORDER_TOMBSTONE_RETENTION_DAYS; clients with an
+# older watermark, or one from before the watcher started, are told to resync.
+ORDER_TOMBSTONES_STATE_ID = 'sales_order_tombstones'
+ORDER_TOMBSTONE_RETENTION_DAYS = int(os.getenv('ORDER_TOMBSTONE_RETENTION_DAYS', 7))
+TOMBSTONE_WATCH_SECONDS = int(os.getenv('TOMBSTONE_WATCH_SECONDS', 60))
+# Short, so another worker takes over soon when the watching one dies
+TOMBSTONE_LEASE_SECONDS = TOMBSTONE_WATCH_SECONDS * 2
+
+# Server error codes after which the stored resume token is useless
+CHANGE_STREAM_HISTORY_LOST = (280, 286)
+# Change streams need a replica set (every Atlas cluster is one)
+CHANGE_STREAMS_UNSUPPORTED = (40573,)
+# Unknown field: servers before 6.0 reject fullDocumentBeforeChange
+PRE_IMAGES_UNSUPPORTED = (40415,)
+
+TOMBSTONE_BATCH_SIZE = 10000
+
+# pre_images is set once create_mongodb_indexes() has enabled them
+tombstone_watch_state = {"supported": True, "pre_images": False}
+
+def watch_deleted_orders():
+    """Record deleted sales orders as tombstones for TOMBSTONE_WATCH_SECONDS"""
+    if not tombstone_watch_state["supported"] or not acquire_job_lease(ORDER_TOMBSTONES_STATE_ID, TOMBSTONE_LEASE_SECONDS):
+        return 0
+    try:
+        state = rollup_state_collection.find_one({"_id": ORDER_TOMBSTONES_STATE_ID}) or {}
+        resume_token = state.get("resume_token")
+        watch_options = {"full_document_before_change": "whenAvailable"} if tombstone_watch_state["pre_images"] else {}
+
+        recorded = 0
+        deadline = time.monotonic() + TOMBSTONE_WATCH_SECONDS
+        with sales_orders_collection.watch(
+            [{"$match": {"operationType": "delete"}}],
+            resume_after=resume_token,
+            max_await_time_ms=1000,
+            **watch_options
+        ) as stream:
+            if not resume_token:
+                # The stream is open: deletions before this moment are unknown
+                rollup_state_collection.update_one(
+                    {"_id": ORDER_TOMBSTONES_STATE_ID},
+                    {"$set": {"watching_since": datetime.utcnow()}},
+                    upsert=True
+                )
+            while stream.alive and time.monotonic() < deadline:
+                change = stream.try_next()
+                if change is not None:
+                    order_tombstones_collection.update_one(
+                        {"_id": change["documentKey"]["_id"]},
+                        {"$setOnInsert": {
+                            "updated_at": datetime.utcnow(),
+                            "deleted_at": change.get("wallTime"),
+                            # From the pre-image, when enabled: lets the rollups recompute the order's day
+                            "created_at": (change.get("fullDocumentBeforeChange") or {}).get("created_at")
+                        }},
+                        upsert=True
+                    )
+                    recorded += 1
+                if stream.resume_token and stream.resume_token != resume_token:
+                    resume_token = stream.resume_token
+                    rollup_state_collection.update_one(
+                        {"_id": ORDER_TOMBSTONES_STATE_ID},
+                        {"$set": {"resume_token": resume_token}}
+                    )
+
+        if recorded:
+            logger.info(f"[DELTA SYNC] Recorded {recorded} deleted order(s)")
+        return recorded
+
+    except OperationFailure as e:
+        if e.code in CHANGE_STREAM_HISTORY_LOST:
+            logger.warning("[DELTA SYNC] Change stream history lost, restarting deletion tracking")
+            rollup_state_collection.update_one({"_id": ORDER_TOMBSTONES_STATE_ID}, {"$unset": {"resume_token": ""}})
+            return 0
+        if e.code in CHANGE_STREAMS_UNSUPPORTED:
+            logger.warning("[DELTA SYNC] Change streams unavailable, deleted orders will not be reported")
+            tombstone_watch_state["supported"] = False
+            rollup_state_collection.update_one({"_id": ORDER_TOMBSTONES_STATE_ID}, {"$unset": {"watching_since": ""}})
+            return 0
+        if e.code in PRE_IMAGES_UNSUPPORTED and tombstone_watch_state["pre_images"]:
+            logger.warning("[DELTA SYNC] Server rejects pre-images, watching deletions without them")
+            tombstone_watch_state["pre_images"] = False
+            return 0
+        raise
+    finally:
+        release_job_lease(ORDER_TOMBSTONES_STATE_ID)
+
+def deleted_orders_after(since, since_id, limit=TOMBSTONE_BATCH_SIZE):
+    """Tombstones after a (updated_at, _id) position, for the materialized views to apply"""
+    return list(budgeted(order_tombstones_collection.find(changed_after(since, since_id))
+                         .sort([("updated_at", 1), ("_id", 1)])
+                         .limit(limit)))
+
+def parse_watermark_id(value):
+    """_id half of a watermark: an ObjectId when it looks like one"""
+    return ObjectId(value) if ObjectId.is_valid(value) else value
+
+def changed_after(since, since_id):
+    """Documents strictly after the (updated_at, _id) watermark"""
+    if since is None:
+        return {"updated_at": {"$type": "date"}}
+    if since_id is None:
+        return {"updated_at": {"$gt": since}}
+    return {"$or": [
+        {"updated_at": {"$gt": since}},
+        {"updated_at": since, "_id": {"$gt": since_id}}
+    ]}
+
+def change_position(doc):
+    # str(_id) sorts ObjectIds like the server does (fixed-width hex)
+    return (doc["updated_at"], str(doc["_id"]))
+
+@app.route('/api/sales-orders/changes', methods=['GET'])
+def get_sales_order_changes():
+    """Get orders changed and deleted after a (since, since_id) watermark, with the next watermark"""
+    try:
+        if not mongodb_connected or not mongo_client:
+            return jsonify({"status": "error", "message": "Database connection failed"}), 500
+
+        limit = page_limit(MAX_PAGE_SIZE)
+        since = since_id = None
+        if request.args.get('since'):
+            try:
+                since = parse_iso_utc(request.args['since'])
+            except ValueError:
+                return jsonify({"status": "error", "message": "Invalid since, expected an ISO timestamp"}), 400
+            if request.args.get('since_id'):
+                since_id = parse_watermark_id(request.args['since_id'])
+
+        query = changed_after(since, since_id)
+        orders = budgeted(sales_orders_collection.find(query, SALES_ORDER_LIST_PROJECTION)
+                          .sort([("updated_at", 1), ("_id", 1)])
+                          .hint(SALES_ORDER_CHANGES_INDEX)
+                          .limit(limit + 1))
+        tombstones = budgeted(order_tombstones_collection.find(query)
+                              .sort([("updated_at", 1), ("_id", 1)])
+                              .limit(limit + 1))
+
+        changes = list(heapq.merge(
+            ((change_position(o), o, False) for o in orders),
+            ((change_position(t), t, True) for t in tombstones),
+            key=lambda change: change[0]
+        ))
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        data = [format_sales_order_row(doc) for _, doc, deleted in changes if not deleted]
+        deleted = [{"id": str(doc["_id"]), "deleted_at": as_iso(doc.get("deleted_at") or doc["updated_at"])} for _, doc, deleted in changes if deleted]
+
+        if changes:
+            last = changes[-1][1]
+            watermark = {"since": as_iso(last["updated_at"]), "since_id": str(last["_id"])}
+        else:
+            watermark = {"since": request.args.get('since') or None, "since_id": request.args.get('since_id') or None}
+
+        # Without a watcher (no change streams, or not started yet) deletions are
+        # simply not reported; otherwise flag watermarks older than what is tracked
+        state = rollup_state_collection.find_one({"_id": ORDER_TOMBSTONES_STATE_ID}, {"watching_since": 1}) or {}
+        deletions_tracked = state.get("watching_since") is not None
+        resync_required = deletions_tracked and since is not None and since < max(
+            state["watching_since"],
+            datetime.utcnow() - timedelta(days=ORDER_TOMBSTONE_RETENTION_DAYS)
+        )
+
+        return jsonify({
+            "status": "success",
+            "data": data,
+            "deleted": deleted,
+            "watermark": watermark,
+            "has_more": has_more,
+            "deletions_tracked": deletions_tracked,
+            "resync_required": resync_required
+        })
+
+    except ExecutionTimeout as e:
+        return query_timeout_response(e)
+    except Exception as e:
+        logger.error(f"[API ERROR] Sales order changes error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ============= BACKGROUND REFRESH =============
+def start_background_refresh():
+    """Start the background cache refresh threads"""
+    run_periodically("filter-options", refresh_filter_options, FILTER_OPTIONS_REFRESH_SECONDS)
+    run_periodically("daily-rollups", refresh_daily_rollups, ROLLUP_REFRESH_SECONDS)
+    run_periodically("search-keys", refresh_search_keys, SEARCH_KEYS_REFRESH_SECONDS)
+    run_periodically("line-items", refresh_line_items, LINE_ITEMS_REFRESH_SECONDS)
+    run_periodically("order-tombstones", watch_deleted_orders, 5)
+    logger.info("[CACHE] Background refresh started")
+
+# ============= STARTUP =============
+MONGODB_RECONNECT_SECONDS = int(os.getenv('MONGODB_RECONNECT_SECONDS', 30))
+
+def connect_until_connected():
+    """Connect to MongoDB, retrying until the cluster answers, then start background work"""
+    global mongodb_connected
+    
+    while True:
+        mongodb_connected = initialize_mongodb()
+        logger.info(f"[STARTUP] MongoDB connected: {mongodb_connected} (pid {os.getpid()})")
+        if mongodb_connected:
+            break
+        if mongo_client:
+            mongo_client.close()
+        time.sleep(MONGODB_RECONNECT_SECONDS)
+    
+    create_mongodb_indexes()
+    start_background_refresh()
+    # Switch from snapshots to live data now rather than at the next scheduled refresh
+    try:
+        refresh_snapshots()
+    except Exception as e:
+        logger.error(f"[SNAPSHOT ERROR] Refresh after connect failed: {e}")
+
+def init_worker():
+    """Connect to MongoDB and start background work in the current process.
+    
+    The production server calls this after fork in every worker (see
+    gunicorn.conf.py), so a MongoClient is never shared between processes.
+    Connecting happens on a background thread: until it succeeds the worker
+    serves local snapshots, and a cluster that is down at startup is retried
+    every MONGODB_RECONNECT_SECONDS.
+    """
+    threading.Thread(target=connect_until_connected, name="mongodb-connect", daemon=True).start()
+    run_periodically("snapshots", refresh_snapshots, SNAPSHOT_REFRESH_SECONDS)
+
+# Dev server / plain import: connect now. gunicorn.conf.py sets DEFER_MONGODB_INIT
+# so the master process never opens a client. Under `python app.py` the
+# reloader's parent only watches files; the child it starts (WERKZEUG_RUN_MAIN)
+# serves requests and connects.
+is_reloader_parent = __name__ == "__main__" and os.getenv('WERKZEUG_RUN_MAIN') != 'true'
+if os.getenv('DEFER_MONGODB_INIT') != '1' and not is_reloader_parent:
+    init_worker()
+
 if __name__ == "__main__":
     logger.info("[FLASK API] Starting Katana-DCL Dashboard API server...")
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
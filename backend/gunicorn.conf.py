@@ -0,0 +1,97 @@
+# backend/gunicorn.conf.py - Production server configuration
+#
+# Run from backend/ with:
+#     pip install gunicorn
+#     gunicorn -c gunicorn.conf.py
+#
+# Graceful reload (new code, new workers, in-flight requests finish):
+#     kill -HUP <master pid>
+#
+# ============= CAPACITY MODEL =============
+# Every worker is a separate process with its own MongoClient, created after
+# fork in post_worker_init. Each worker serves up to THREADS requests at once:
+#
+#     concurrent requests     = WEB_CONCURRENCY x GUNICORN_THREADS
+#     connections per worker  = GUNICORN_THREADS x SEARCH_FANOUT + BACKGROUND_CONNECTIONS
+#     connections per server  = WEB_CONCURRENCY x connections per worker
+#
+# Most requests hold one connection, but /api/search runs one lookup per
+# collection at once (SEARCH_FANOUT), so the worst case is every thread
+# searching. On top of that each worker runs background loops: filter options,
+# daily rollups, search keys, line items, snapshot replay, the disconnect
+# monitor, and the deleted-order change stream, which keeps a connection busy
+# in awaitData for as long as it watches.
+#
+# The per-worker pool is capped so that the whole server stays under
+# MONGODB_MAX_CONNECTIONS, the share of the cluster's connection limit this
+# host may use (Atlas M10 allows 1500 in total, spread over every app server).
+# If the cap is lower than the thread count, extra threads wait up to
+# waitQueueTimeoutMS for a connection instead of opening new ones.
+#
+# Endpoints spend most of their time waiting on MongoDB, so threads are cheap
+# and workers mainly buy CPU for JSON serialization: start with one worker per
+# core and raise threads until p95 latency stops improving (measure with
+# `python load_test.py`, which reports the saturation point of each setting).
+#
+# Size the server with WEB_CONCURRENCY and GUNICORN_THREADS rather than -w/
+# --threads, so the pool sizes below are derived from the real counts.
+import multiprocessing
+import os
+
+# app.py must not connect at import: with preload_app the import happens in the
+# master, and a MongoClient must never be shared across fork
+os.environ['DEFER_MONGODB_INIT'] = '1'
+
+# Background threads per worker (see the capacity model above)
+BACKGROUND_CONNECTIONS = 7
+# Concurrent lookups of one /api/search request (SEARCH_SOURCES in app.py)
+SEARCH_FANOUT = 4
+
+WORKERS = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+THREADS = int(os.getenv('GUNICORN_THREADS', 8))
+MONGODB_MAX_CONNECTIONS = int(os.getenv('MONGODB_MAX_CONNECTIONS', 200))
+
+wsgi_app = 'app:app'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = WORKERS
+worker_class = 'gthread'
+threads = THREADS
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+# Requests are bounded by the query budgets in app.py; this only catches hung workers
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+def pool_size_per_worker():
+    """Pool size that serves every thread without exceeding the server-wide connection budget"""
+    wanted = THREADS * SEARCH_FANOUT + BACKGROUND_CONNECTIONS
+    return max(1, min(wanted, MONGODB_MAX_CONNECTIONS // WORKERS))
+
+# Read by app.py when the worker creates its MongoClient. Computed from the
+# model above unless MONGODB_MAX_POOL_SIZE is set explicitly.
+os.environ.setdefault('MONGODB_MAX_POOL_SIZE', str(pool_size_per_worker()))
+os.environ.setdefault('MONGODB_MIN_POOL_SIZE', '1')
+
+def when_ready(server):
+    pool_size = int(os.environ['MONGODB_MAX_POOL_SIZE'])
+    server.log.info(
+        f"[GUNICORN] {WORKERS} workers x {THREADS} threads, "
+        f"MongoDB pool {pool_size} per worker "
+        f"({WORKERS * pool_size} of {MONGODB_MAX_CONNECTIONS} connections)"
+    )
+    if WORKERS * pool_size > MONGODB_MAX_CONNECTIONS:
+        server.log.warning(f"[GUNICORN] MONGODB_MAX_POOL_SIZE={pool_size} exceeds the MONGODB_MAX_CONNECTIONS budget")
+
+def post_worker_init(worker):
+    # Runs in the worker after fork: this is where its MongoClient is created
+    import app
+    app.init_worker()
@@ -0,0 +1,267 @@
+# backend/load_test.py - Dashboard load generator
+#
+# Simulates N browser tabs replaying the frontend's real call pattern against a
+# running API and ramps N up stage by stage until the server saturates:
+#
+#   dashboard open   /api/sales-stats               (Dashboard: useDashboardData)
+#                    /api/status-distribution       (StatusDistributionChart)
+#                    /api/sales-orders?page=1&limit=5
+#                                                   (RecentOrdersTable, once)
+#   every 30s        /api/sales-stats, /api/status-distribution
+#   (OrderFlowChart fetches nothing; useOrders.ts's dashboard hooks are unused)
+#   (a tick's requests are sent concurrently, as the browser does)
+#   browsing         /api/sales-orders/filters, then page changes on
+#                    /api/sales-orders?page=N&limit=20
+#   searching        /api/sales-orders?order_number=<prefix> per keystroke
+#
+# Usage (API on :5000, e.g. `gunicorn -c gunicorn.conf.py` or `python app.py`):
+#   python load_test.py --stages 10,25,50,100,200 --stage-seconds 60
+#   python load_test.py --time-scale 0.1     # 30s polls every 3s
+#
+# If MONGODB_CONNECTION_STRING is set, MongoDB operations per second are read
+# from serverStatus opcounters (the whole server, so use a dedicated mongod).
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from dotenv import load_dotenv
+
+load_dotenv()
+
+POLL_ENDPOINTS = [
+    "/api/sales-stats",
+    "/api/status-distribution"
+]
+OPEN_ENDPOINTS = POLL_ENDPOINTS + ["/api/sales-orders?page=1&limit=5"]
+KEYSTROKE_SECONDS = 0.25
+
+
+class Recorder:
+    """Thread-safe latency/status log for the current stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+
+    def record(self, endpoint, latency_ms, ok):
+        with self.lock:
+            self.samples.append((endpoint, latency_ms, ok))
+
+    def drain(self):
+        with self.lock:
+            samples, self.samples = self.samples, []
+        return samples
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def get(base_url, path, recorder, timeout):
+    endpoint = urllib.parse.urlsplit(path).path
+    started = time.perf_counter()
+    ok = False
+    try:
+        with urllib.request.urlopen(base_url + path, timeout=timeout) as response:
+            response.read()
+            ok = response.status < 400
+    except urllib.error.HTTPError as e:
+        e.read()
+    except Exception:
+        pass
+    recorder.record(endpoint, (time.perf_counter() - started) * 1000, ok)
+
+
+def get_concurrently(base_url, paths, recorder, timeout):
+    """Fire one tick's requests at once, like the dashboard's independent hooks"""
+    threads = [
+        threading.Thread(target=get, args=(base_url, path, recorder, timeout), daemon=True)
+        for path in paths
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def tab(args, recorder, stop, order_numbers):
+    """One browser tab: open the dashboard, then poll, browse and search until stopped"""
+    poll_interval = 30 * args.time_scale
+
+    # Tabs are not opened in lockstep
+    if stop.wait(random.uniform(0, poll_interval)):
+        return
+    get_concurrently(args.base_url, OPEN_ENDPOINTS, recorder, args.timeout)
+
+    while not stop.wait(poll_interval):
+        get_concurrently(args.base_url, POLL_ENDPOINTS, recorder, args.timeout)
+
+        if random.random() < args.browse_probability:
+            get(args.base_url, "/api/sales-orders/filters", recorder, args.timeout)
+            for page in range(1, random.randint(2, 5)):
+                get(args.base_url, f"/api/sales-orders?page={page}&limit=20", recorder, args.timeout)
+
+        if order_numbers and random.random() < args.search_probability:
+            order_number = random.choice(order_numbers)
+            for length in range(1, len(order_number) + 1):
+                if stop.wait(KEYSTROKE_SECONDS * args.time_scale):
+                    return
+                query = urllib.parse.urlencode({"page": 1, "limit": 20, "order_number": order_number[:length]})
+                get(args.base_url, f"/api/sales-orders?{query}", recorder, args.timeout)
+
+
+def sample_order_numbers(base_url, timeout):
+    try:
+        with urllib.request.urlopen(f"{base_url}/api/sales-orders?page=1&limit=20", timeout=timeout) as response:
+            orders = json.loads(response.read()).get("data", [])
+        return [o["order_number"] for o in orders if o.get("order_number") not in (None, "N/A")]
+    except Exception as e:
+        print(f"[LOAD TEST] Could not sample order numbers, search is disabled: {e}")
+        return []
+
+
+class MongoOpCounter:
+    """MongoDB operations per second from serverStatus opcounters"""
+
+    def __init__(self, connection_string):
+        self.client = None
+        if connection_string:
+            from pymongo import MongoClient
+            self.client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
+
+    def total(self):
+        if not self.client:
+            return None
+        counters = self.client.admin.command("serverStatus")["opcounters"]
+        return sum(counters.values())
+
+
+def run_stage(args, concurrency, recorder, order_numbers, ops):
+    stop = threading.Event()
+    tabs = [
+        threading.Thread(target=tab, args=(args, recorder, stop, order_numbers), daemon=True)
+        for _ in range(concurrency)
+    ]
+    recorder.drain()
+    ops_before = ops.total()
+    started = time.perf_counter()
+    for t in tabs:
+        t.start()
+
+    time.sleep(args.stage_seconds)
+    stop.set()
+    elapsed = time.perf_counter() - started
+    samples = recorder.drain()
+    ops_after = ops.total()
+    for t in tabs:
+        t.join(timeout=args.timeout)
+
+    latencies = sorted(latency for _, latency, _ in samples)
+    errors = sum(1 for _, _, ok in samples if not ok)
+    by_endpoint = {}
+    for endpoint, latency, ok in samples:
+        stats = by_endpoint.setdefault(endpoint, {"requests": 0, "errors": 0, "latencies": []})
+        stats["requests"] += 1
+        stats["errors"] += 0 if ok else 1
+        stats["latencies"].append(latency)
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "throughput_rps": len(samples) / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "mongo_ops_per_sec": (ops_after - ops_before) / elapsed if ops_before is not None else None,
+        "endpoints": {
+            endpoint: {
+                "requests": stats["requests"],
+                "errors": stats["errors"],
+                "p95_ms": percentile(sorted(stats["latencies"]), 95)
+            }
+            for endpoint, stats in sorted(by_endpoint.items())
+        }
+    }
+
+
+def saturation_reason(previous, current, args):
+    """Why this stage counts as saturated, or None"""
+    if current["error_rate"] > args.max_error_rate:
+        return f"error rate {current['error_rate']:.1%} > {args.max_error_rate:.1%}"
+    if current["p95_ms"] > args.p95_slo_ms:
+        return f"p95 {current['p95_ms']:.0f}ms > {args.p95_slo_ms:.0f}ms"
+    if previous and current["throughput_rps"] < previous["throughput_rps"] * 1.05:
+        return "throughput stopped growing with concurrency"
+    return None
+
+
+def print_stage(result):
+    ops = f"{result['mongo_ops_per_sec']:8.1f}" if result["mongo_ops_per_sec"] is not None else "     n/a"
+    print(
+        f"{result['concurrency']:6d} {result['requests']:9d} {result['throughput_rps']:9.1f} "
+        f"{result['p50_ms']:8.0f} {result['p95_ms']:8.0f} {result['p99_ms']:8.0f} "
+        f"{result['error_rate']:7.1%} {ops}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the dashboard's polling pattern with ramping concurrency")
+    parser.add_argument("--base-url", default=os.getenv("LOAD_TEST_BASE_URL", "http://localhost:5000"))
+    parser.add_argument("--stages", default="10,25,50,100,200", help="comma-separated tab counts")
+    parser.add_argument("--stage-seconds", type=float, default=60)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiplier for the 30s poll interval and keystroke delay")
+    parser.add_argument("--browse-probability", type=float, default=0.2, help="chance per poll that a tab pages through sales orders")
+    parser.add_argument("--search-probability", type=float, default=0.1, help="chance per poll that a tab types an order number")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--p95-slo-ms", type=float, default=1000)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGODB_CONNECTION_STRING"))
+    parser.add_argument("--json", help="write per-stage results to this file")
+    parser.add_argument("--keep-going", action="store_true", help="run every stage even after saturation")
+    args = parser.parse_args()
+
+    stages = [int(s) for s in args.stages.split(",") if s.strip()]
+    recorder = Recorder()
+    ops = MongoOpCounter(args.mongo_uri)
+    order_numbers = sample_order_numbers(args.base_url, args.timeout)
+
+    print(f"[LOAD TEST] {args.base_url}, stages {stages}, {args.stage_seconds:.0f}s each, poll every {30 * args.time_scale:.1f}s")
+    print("  tabs  requests   req/s    p50ms    p95ms    p99ms  errors  mongo/s")
+
+    results = []
+    saturated_at = None
+    for concurrency in stages:
+        result = run_stage(args, concurrency, recorder, order_numbers, ops)
+        print_stage(result)
+        reason = saturation_reason(results[-1] if results else None, result, args)
+        results.append(result)
+        if reason and saturated_at is None:
+            saturated_at = {"concurrency": concurrency, "reason": reason}
+            if not args.keep_going:
+                break
+
+    if saturated_at:
+        print(f"[LOAD TEST] Saturated at {saturated_at['concurrency']} tabs: {saturated_at['reason']}")
+    else:
+        print("[LOAD TEST] No saturation up to the last stage")
+
+    slowest = max(results[-1]["endpoints"].items(), key=lambda item: item[1]["p95_ms"], default=None)
+    if slowest:
+        print(f"[LOAD TEST] Slowest endpoint in the last stage: {slowest[0]} (p95 {slowest[1]['p95_ms']:.0f}ms)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"stages": results, "saturated_at": saturated_at}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,33 @@
 import { PieChart, Pie, Cell, ResponsiveContainer, Tooltip, Legend } from 'recharts';
+import { useStatusDistribution } from '@/hooks/useDashboardData';
 
-const data = [
-  { name: 'Completed', value: 203, color: 'hsl(var(--success))' },
-  { name: 'Processing', value: 34, color: 'hsl(var(--warning))' },
-  { name: 'Pending', value: 24, color: 'hsl(var(--muted-foreground))' },
-  { name: 'Failed', value: 10, color: 'hsl(var(--destructive))' },
-];
+const STATUS_COLORS: Record<string, string> = {
+  complete: 'hsl(var(--success))',
+  completed: 'hsl(var(--success))',
+  processing: 'hsl(var(--warning))',
+  not_shipped: 'hsl(var(--warning))',
+  pending: 'hsl(var(--muted-foreground))',
+  failed: 'hsl(var(--destructive))',
+};
+const FALLBACK_COLORS = ['hsl(var(--primary))', '#06b6d4', '#8b5cf6', '#ec4899', '#84cc16'];
+
+const formatLabel = (status: string) =>
+  status.replace(/_/g, ' ').replace(/\b\w/g, (c) => c.toUpperCase());
 
 export const StatusDistributionChart = () => {
+  const { cells, totals } = useStatusDistribution();
+
+  const data = Object.entries(totals?.by_status || {}).map(([status, value], index) => ({
+    name: formatLabel(status),
+    value,
+    color: STATUS_COLORS[status.toLowerCase()] || FALLBACK_COLORS[index % FALLBACK_COLORS.length],
+    // DCL status breakdown for this order status, largest first
+    dcl: cells
+      .filter((cell) => cell.status === status)
+      .map((cell) => `${formatLabel(cell.dcl_status)}: ${cell.count}`)
+      .join(', '),
+  }));
+
   return (
     <div className="chart-container">
       <div className="flex items-center justify-between mb-6">
@@ -32,6 +52,10 @@ export const StatusDistributionChart = () => {
               ))}
             </Pie>
             <Tooltip
+              formatter={(value: number, name: string, item: any) => [
+                item?.payload?.dcl ? `${value} (${item.payload.dcl})` : value,
+                name,
+              ]}
               contentStyle={{
                 backgroundColor: 'hsl(var(--card))',
                 border: '1px solid hsl(var(--border))',
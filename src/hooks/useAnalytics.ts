@@ -0,0 +1,56 @@
+import { useState, useEffect } from "react";
+
+const API_BASE_URL = import.meta.env.VITE_API_URL || "http://localhost:5000";
+
+export type AnalyticsInterval = "day" | "week" | "month";
+export type AnalyticsGroupBy = "" | "currency" | "location_id" | "status";
+
+export interface AnalyticsPoint {
+  period: string;
+  // null when the point spans several currencies: use revenue_by_currency
+  revenue: number | null;
+  revenue_by_currency: Record<string, number>;
+  orders: number;
+  currency?: string;
+  location_id?: number | string | null;
+  status?: string;
+}
+
+export const useAnalyticsTimeseries = (interval: AnalyticsInterval = "day", groupBy: AnalyticsGroupBy = "") => {
+  const [data, setData] = useState<AnalyticsPoint[]>([]);
+  const [refreshedAt, setRefreshedAt] = useState<string | null>(null);
+  const [loading, setLoading] = useState(true);
+  const [error, setError] = useState<string | null>(null);
+
+  const fetchData = async () => {
+    try {
+      setLoading(true);
+      setError(null);
+
+      const params = new URLSearchParams({ interval });
+      if (groupBy) params.append("group_by", groupBy);
+
+      const res = await fetch(`${API_BASE_URL}/api/analytics/timeseries?${params.toString()}`);
+      if (!res.ok) throw new Error("Failed to fetch analytics data");
+      const json = await res.json();
+
+      if (json.status === "success") {
+        setData(json.data || []);
+        setRefreshedAt(json.rollup_refreshed_at);
+      } else {
+        throw new Error(json.message || "Failed to fetch analytics data");
+      }
+    } catch (err: any) {
+      setError(err.message || "Unknown error");
+      setData([]);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  useEffect(() => {
+    fetchData();
+  }, [interval, groupBy]);
+
+  return { data, refreshedAt, loading, error, refetch: fetchData };
+};
@@ -145,3 +145,43 @@ export const useRecentOrders = () => {
 
   return { orders, loading, error };
 };
+
+export interface StatusDistributionCell {
+  status: string;
+  dcl_status: string;
+  count: number;
+}
+
+// Status x DCL status matrix for the StatusDistributionChart
+export const useStatusDistribution = (dateFilter: string = '') => {
+  const [cells, setCells] = useState<StatusDistributionCell[]>([]);
+  const [totals, setTotals] = useState<{ by_status: Record<string, number>; by_dcl_status: Record<string, number>; total: number } | null>(null);
+  const [loading, setLoading] = useState(true);
+  const [error, setError] = useState<string | null>(null);
+
+  useEffect(() => {
+    const fetchDistribution = async () => {
+      try {
+        const params = dateFilter ? `?date_filter=${dateFilter}` : '';
+        const res = await fetch(`${API_BASE_URL}/api/status-distribution${params}`);
+        if (!res.ok) throw new Error('Failed to fetch status distribution');
+        const json = await res.json();
+        setCells(json.data || []);
+        setTotals(json.totals);
+        setError(null);
+      } catch (err) {
+        setError(err instanceof Error ? err.message : 'Unknown error');
+      } finally {
+        setLoading(false);
+      }
+    };
+
+    fetchDistribution();
+
+    // Auto-refresh every 30 seconds
+    const interval = setInterval(fetchDistribution, 30000);
+    return () => clearInterval(interval);
+  }, [dateFilter]);
+
+  return { cells, totals, loading, error };
+};
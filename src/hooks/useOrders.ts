@@ -101,6 +101,7 @@ interface ApiResponse<T> {
     current_page: number;
     total_pages: number;
     total_count: number;
+    count_exact?: boolean;
     has_next: boolean;
     has_prev: boolean;
   };
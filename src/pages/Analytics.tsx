@@ -1,17 +1,138 @@
+import { useMemo, useState } from "react";
+import {
+  LineChart,
+  Line,
+  XAxis,
+  YAxis,
+  CartesianGrid,
+  Tooltip,
+  ResponsiveContainer,
+  Legend,
+} from "recharts";
+import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
+import { useAnalyticsTimeseries, AnalyticsGroupBy, AnalyticsInterval } from "@/hooks/useAnalytics";
+
+const SERIES_COLORS = ["#4f46e5", "#10b981", "#f59e0b", "#ef4444", "#06b6d4", "#8b5cf6", "#ec4899", "#84cc16"];
+
+const tooltipStyle = {
+  backgroundColor: "hsl(var(--card))",
+  border: "1px solid hsl(var(--border))",
+  borderRadius: "8px",
+  color: "hsl(var(--foreground))",
+};
+
 export const Analytics = () => {
+  const [timeInterval, setTimeInterval] = useState<AnalyticsInterval>("day");
+  const [groupBy, setGroupBy] = useState<AnalyticsGroupBy>("");
+  const { data, refreshedAt, loading, error } = useAnalyticsTimeseries(timeInterval, groupBy);
+
+  // Pivot {period, key, revenue_by_currency, orders} rows into one row per period
+  // with a column per series. Revenue always gets one series per currency.
+  const { rows, orderKeys, revenueKeys } = useMemo(() => {
+    const byPeriod = new Map<string, Record<string, any>>();
+    const orderKeys = new Set<string>();
+    const revenueKeys = new Set<string>();
+    for (const point of data) {
+      const key = groupBy ? String(point[groupBy] ?? "unknown") : "";
+      const row = byPeriod.get(point.period) || { period: point.period };
+
+      const orderKey = key || "Orders";
+      orderKeys.add(orderKey);
+      row[`orders:${orderKey}`] = point.orders;
+
+      for (const [currency, revenue] of Object.entries(point.revenue_by_currency || {})) {
+        const revenueKey = groupBy && groupBy !== "currency" ? `${key} (${currency})` : currency;
+        revenueKeys.add(revenueKey);
+        row[`revenue:${revenueKey}`] = revenue;
+      }
+      byPeriod.set(point.period, row);
+    }
+    return { rows: Array.from(byPeriod.values()), orderKeys: Array.from(orderKeys), revenueKeys: Array.from(revenueKeys) };
+  }, [data, groupBy]);
+
+  const renderChart = (metric: "revenue" | "orders", title: string, keys: string[]) => (
+    <div className="chart-container">
+      <div className="flex items-center justify-between mb-6">
+        <h3 className="text-lg font-semibold text-foreground">{title}</h3>
+      </div>
+      <div className="h-80">
+        <ResponsiveContainer width="100%" height="100%">
+          <LineChart data={rows} margin={{ top: 10, right: 30, left: 10, bottom: 10 }}>
+            <CartesianGrid strokeDasharray="3 3" />
+            <XAxis dataKey="period" fontSize={12} />
+            <YAxis fontSize={12} />
+            <Tooltip contentStyle={tooltipStyle} />
+            <Legend />
+            {keys.map((key, index) => (
+              <Line
+                key={key}
+                type="monotone"
+                dataKey={`${metric}:${key}`}
+                name={key}
+                stroke={SERIES_COLORS[index % SERIES_COLORS.length]}
+                strokeWidth={2}
+                dot={false}
+              />
+            ))}
+          </LineChart>
+        </ResponsiveContainer>
+      </div>
+    </div>
+  );
+
   return (
     <div className="space-y-6">
-      <div>
-        <h1 className="text-3xl font-bold text-foreground">Analytics</h1>
-        <p className="text-muted-foreground">Deep insights into your business performance.</p>
-      </div>
-      
-      <div className="chart-container min-h-96 flex items-center justify-center">
-        <div className="text-center">
-          <h3 className="text-lg font-semibold text-foreground mb-2">Advanced Analytics</h3>
-          <p className="text-muted-foreground">Comprehensive analytics dashboard coming soon.</p>
+      <div className="flex items-center justify-between">
+        <div>
+          <h1 className="text-3xl font-bold text-foreground">Analytics</h1>
+          <p className="text-muted-foreground">Deep insights into your business performance.</p>
+        </div>
+        <div className="flex items-center gap-4">
+          <Select value={timeInterval} onValueChange={(value) => setTimeInterval(value as AnalyticsInterval)}>
+            <SelectTrigger className="w-36">
+              <SelectValue placeholder="Interval" />
+            </SelectTrigger>
+            <SelectContent>
+              <SelectItem value="day">Daily</SelectItem>
+              <SelectItem value="week">Weekly</SelectItem>
+              <SelectItem value="month">Monthly</SelectItem>
+            </SelectContent>
+          </Select>
+          <Select value={groupBy || "none"} onValueChange={(value) => setGroupBy(value === "none" ? "" : (value as AnalyticsGroupBy))}>
+            <SelectTrigger className="w-44">
+              <SelectValue placeholder="Breakdown" />
+            </SelectTrigger>
+            <SelectContent>
+              <SelectItem value="none">No breakdown</SelectItem>
+              <SelectItem value="currency">By currency</SelectItem>
+              <SelectItem value="location_id">By location</SelectItem>
+              <SelectItem value="status">By status</SelectItem>
+            </SelectContent>
+          </Select>
         </div>
       </div>
+
+      {error && (
+        <div className="bg-destructive/20 border border-destructive/30 text-destructive px-4 py-3 rounded-lg">
+          Error loading analytics: {error}
+        </div>
+      )}
+
+      {loading ? (
+        <div className="chart-container min-h-96 flex items-center justify-center">
+          <p className="text-muted-foreground">Loading analytics...</p>
+        </div>
+      ) : (
+        <>
+          {renderChart("revenue", "Revenue by Currency", revenueKeys)}
+          {renderChart("orders", "Order Volume", orderKeys)}
+          {refreshedAt && (
+            <div className="text-sm text-muted-foreground">
+              Rollups refreshed: {new Date(refreshedAt).toLocaleString()}
+            </div>
+          )}
+        </>
+      )}
     </div>
   );
-};
\ No newline at end of file
+};
@@ -45,6 +45,10 @@ export const SalesOrders = () => {
 
   const { filterOptions } = useSalesOrderFilters();
 
+  // Document counts for a filter value, as returned by /api/sales-orders/filters
+  const optionCount = (counts: Array<{ value: string; count: number }> | undefined, value: string) =>
+    counts?.find((option) => option.value === value)?.count;
+
   // Apply filters
   const handleFilterChange = () => {
     setCurrentPage(1); // Reset to first page when filtering
@@ -158,7 +162,7 @@ export const SalesOrders = () => {
           <h1 className="text-3xl font-bold text-foreground">Sales Orders</h1>
           <p className="text-muted-foreground">
             Manage sales orders from Katana DCL system. 
-            {pagination && ` (${pagination.total_count} total orders)`}
+            {pagination && pagination.total_count != null && ` (${pagination.total_count}${pagination.count_exact === false ? '+' : ''} total orders)`}
           </p>
         </div>
         <div className="flex items-center gap-2">
@@ -201,10 +205,10 @@ export const SalesOrders = () => {
                   </SelectTrigger>
                   <SelectContent>
                     <SelectItem value="">All Dates</SelectItem>
-                    <SelectItem value="today">Today</SelectItem>
-                    <SelectItem value="yesterday">Yesterday</SelectItem>
-                    <SelectItem value="last_7_days">Last 7 Days</SelectItem>
-                    <SelectItem value="last_30_days">Last 30 Days</SelectItem>
+                    <SelectItem value="today">Today{optionCount(filterOptions?.date_filters, "today") !== undefined && ` (${optionCount(filterOptions?.date_filters, "today")})`}</SelectItem>
+                    <SelectItem value="yesterday">Yesterday{optionCount(filterOptions?.date_filters, "yesterday") !== undefined && ` (${optionCount(filterOptions?.date_filters, "yesterday")})`}</SelectItem>
+                    <SelectItem value="last_7_days">Last 7 Days{optionCount(filterOptions?.date_filters, "last_7_days") !== undefined && ` (${optionCount(filterOptions?.date_filters, "last_7_days")})`}</SelectItem>
+                    <SelectItem value="last_30_days">Last 30 Days{optionCount(filterOptions?.date_filters, "last_30_days") !== undefined && ` (${optionCount(filterOptions?.date_filters, "last_30_days")})`}</SelectItem>
                   </SelectContent>
                 </Select>
               </div>
@@ -243,6 +247,7 @@ export const SalesOrders = () => {
                       .map((status) => (
                         <SelectItem key={status} value={status}>
                           {status}
+                          {optionCount(filterOptions?.status_counts, status) !== undefined && ` (${optionCount(filterOptions?.status_counts, status)})`}
                         </SelectItem>
                     ))}
 
@@ -271,6 +276,7 @@ export const SalesOrders = () => {
                       .map((status) => (
                         <SelectItem key={status} value={status}>
                           {status}
+                          {optionCount(filterOptions?.dcl_status_counts, status) !== undefined && ` (${optionCount(filterOptions?.dcl_status_counts, status)})`}
                         </SelectItem>
                     ))}
 
@@ -317,7 +323,7 @@ export const SalesOrders = () => {
               <CardContent>
                 <div className="text-2xl font-bold">{safeOrders.length}</div>
                 <p className="text-xs text-muted-foreground">
-                  {pagination ? `Page ${pagination.current_page} of ${pagination.total_pages}` : 'Active sales orders'}
+                  {pagination ? `Page ${pagination.current_page} of ${pagination.total_pages ?? 'many'}` : 'Active sales orders'}
                 </p>
               </CardContent>
             </Card>
@@ -376,7 +382,7 @@ export const SalesOrders = () => {
                   <CardTitle>Sales Orders</CardTitle>
                   <CardDescription>
                     {pagination ? 
-                      `Showing ${safeOrders.length} of ${pagination.total_count} orders` : 
+                      `Showing ${safeOrders.length} of ${pagination.total_count ?? 'many'}${pagination.count_exact === false && pagination.total_count != null ? '+' : ''} orders` : 
                       `${safeOrders.length} orders`
                     }
                   </CardDescription>
@@ -454,10 +460,10 @@ export const SalesOrders = () => {
               )}
 
               {/* Pagination */}
-              {pagination && pagination.total_pages > 1 && (
+              {pagination && (pagination.total_pages > 1 || pagination.has_next || pagination.has_prev) && (
                 <div className="flex items-center justify-between mt-4">
                   <div className="text-sm text-muted-foreground">
-                    Showing {((pagination.current_page - 1) * pagination.limit) + 1} to {Math.min(pagination.current_page * pagination.limit, pagination.total_count)} of {pagination.total_count} results
+                    Showing {pagination.showing_from} to {pagination.showing_to}{pagination.total_count != null && ` of ${pagination.total_count}${pagination.count_exact === false ? '+' : ''}`} results
                   </div>
                   
                   <div className="flex items-center gap-2">
@@ -472,7 +478,7 @@ export const SalesOrders = () => {
                     </Button>
                     
                     <span className="text-sm">
-                      Page {pagination.current_page} of {pagination.total_pages}
+                      Page {pagination.current_page}{pagination.total_pages != null && ` of ${pagination.total_pages}`}
                     </span>
                     
                     <Button